@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""Benchmark text extraction of pdf2txt and the OCR path of pdf_file_issue.
+
+Every combination of input file, output type and layout profile runs in a
+fresh process, so the peak RSS reported is that of the case alone. Results
+are written as JSON, pass an earlier result as --baseline to compare."""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, cast
+
+import pdfminer
+from pdfminer.converter import HTMLConverter, TextConverter, XMLConverter
+from pdfminer.layout import LAParams, LTPage
+from pdfminer.pdfdevice import PDFDevice, TagExtractor
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+from pdf2txt import (
+    count_pages,
+    extract_files_parallel,
+    extract_to_fp,
+    fast_laparams,
+    file_sha256,
+    open_pdf,
+)
+
+OUTPUT_TYPES = ("text", "html", "xml", "tag")
+
+# layout profiles, "fast" is the first pass of pdf2txt --fast, pages it falls
+# back on cost the same as "default"
+LAPARAMS_PROFILES = {
+    "none": lambda: None,
+    "default": LAParams,
+    "fast": lambda: fast_laparams(LAParams()),
+    "all_texts": lambda: LAParams(all_texts=True),
+    "detect_vertical": lambda: LAParams(detect_vertical=True),
+}
+
+SYNTHETIC_PAGE_COUNTS = (1, 10, 50)
+# the generated pdf of the --mmap case, about 4 kB a page
+MMAP_PAGE_COUNT = 5000
+SYNTHETIC_WORDS = (
+    "the of and to in is was for on that with as by at from bill house senate "
+    "act section amendment state committee report vote law court tax"
+).split()
+
+
+def make_synthetic_pdf(
+    fname: str, pages: int, lines_per_page: int = 45, seed: int = 0
+) -> None:
+    """Write a pdf of pages two-column pages of Helvetica text. The same seed
+    gives the same file, so runs on different machines stay comparable."""
+    rnd = random.Random(seed)
+    objs: List[bytes] = []
+
+    def add(obj: bytes) -> int:
+        objs.append(obj)
+        return len(objs)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")
+    kids = []
+    for _ in range(pages):
+        ops = []
+        for column in range(2):
+            ops.append(b"BT /F1 9 Tf 11 TL %d 760 Td" % (40 + column * 280))
+            for _ in range(lines_per_page):
+                line = " ".join(rnd.choice(SYNTHETIC_WORDS) for _ in range(8))
+                ops.append(b"(" + line.encode() + b") '")
+            ops.append(b"ET")
+        stream = b"\n".join(ops)
+        contents = add(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        kids.append(
+            add(
+                b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+                b"/Contents %d 0 R /Resources << /Font << /F1 %d 0 R >> >> >>"
+                % (pages_id, contents, font)
+            )
+        )
+    objs[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids),
+        pages,
+    )
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for objid, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % objid + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objs) + 1,
+        catalog,
+        xref,
+    )
+    with open(fname, "wb") as fp:
+        fp.write(out)
+
+
+class StageTimingMixin:
+    """Splits the time a layout device spends at the end of each page into
+    the layout analysis and the rendering of the laid out page."""
+
+    layout_time = 0.0
+    render_time = 0.0
+
+    def end_page(self, page: PDFPage) -> None:
+        start = time.perf_counter()
+        render_time = self.render_time
+        super().end_page(page)  # type: ignore[misc]
+        self.layout_time += (
+            time.perf_counter() - start - (self.render_time - render_time)
+        )
+
+    def receive_layout(self, ltpage: LTPage) -> None:
+        start = time.perf_counter()
+        super().receive_layout(ltpage)  # type: ignore[misc]
+        self.render_time += time.perf_counter() - start
+
+
+class TimedTextConverter(StageTimingMixin, TextConverter):
+    pass
+
+
+class TimedHTMLConverter(StageTimingMixin, HTMLConverter):
+    pass
+
+
+class TimedXMLConverter(StageTimingMixin, XMLConverter):
+    pass
+
+
+def create_device(
+    rsrcmgr: PDFResourceManager,
+    outfp: BinaryIO,
+    output_type: str,
+    laparams: Optional[LAParams],
+) -> PDFDevice:
+    if output_type == "text":
+        return TimedTextConverter(rsrcmgr, outfp, laparams=laparams)
+    elif output_type == "html":
+        return TimedHTMLConverter(rsrcmgr, outfp, laparams=laparams)
+    elif output_type == "xml":
+        return TimedXMLConverter(rsrcmgr, outfp, laparams=laparams)
+    elif output_type == "tag":
+        # tags are written while the page is interpreted, there is no layout
+        return TagExtractor(rsrcmgr, outfp)
+    raise ValueError("Output type can be text, html, xml or tag but is {}".format(output_type))
+
+
+def extract_timed(
+    fname: str, output_type: str, laparams: Optional[LAParams]
+) -> Dict[str, Any]:
+    """Extract fname once, timing each stage. Objects are parsed lazily, so
+    "parse" covers the xref, document catalog and page tree and the objects
+    a page needs are parsed as part of "interpret"."""
+    start = time.perf_counter()
+    rsrcmgr = PDFResourceManager()
+    outfp = io.BytesIO()
+    device = create_device(rsrcmgr, outfp, output_type, laparams)
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    with open_pdf(fname) as fp:
+        doc = PDFDocument(PDFParser(fp))
+        pages = list(PDFPage.create_pages(doc))
+        parse_time = time.perf_counter() - start
+        for page in pages:
+            interpreter.process_page(page)
+        device.close()
+    elapsed = time.perf_counter() - start
+    layout_time = getattr(device, "layout_time", 0.0)
+    render_time = getattr(device, "render_time", 0.0)
+    return {
+        "elapsed": elapsed,
+        "pages": len(pages),
+        "output_bytes": len(outfp.getvalue()),
+        "stages": {
+            "parse": parse_time,
+            "interpret": elapsed - parse_time - layout_time - render_time,
+            "layout": layout_time,
+            "render": render_time,
+        },
+    }
+
+
+def peak_rss_kb() -> int:
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def run_extraction_case(
+    fname: str, output_type: str, profile: str, repeat: int
+) -> Dict[str, Any]:
+    """Runs in a fresh worker process. The fastest of repeat runs is
+    reported, the median is kept alongside to show the noise."""
+    baseline_rss = peak_rss_kb()
+    runs = [
+        extract_timed(fname, output_type, LAPARAMS_PROFILES[profile]())
+        for _ in range(repeat)
+    ]
+    best = min(runs, key=lambda run: run["elapsed"])
+    return {
+        "file": fname,
+        "output_type": output_type,
+        "laparams": profile,
+        "pages": best["pages"],
+        "output_bytes": best["output_bytes"],
+        "elapsed": best["elapsed"],
+        "median_elapsed": statistics.median(run["elapsed"] for run in runs),
+        "pages_per_sec": best["pages"] / best["elapsed"] if best["elapsed"] else None,
+        "stages": best["stages"],
+        "baseline_rss_kb": baseline_rss,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def run_ocr_case(fname: str, pages: int, dpi: int) -> Dict[str, Any]:
+    """Rasterize and OCR the first pages of fname the way pdf_file_issue
+    does. Needs poppler and tesseract, the error is reported otherwise."""
+    from todo.pdf_extraction import iter_page_images, tesseract_image
+
+    baseline_rss = peak_rss_kb()
+    page_numbers = range(min(pages, count_pages(fname)))
+    rasterize_time = ocr_time = 0.0
+    try:
+        start = time.perf_counter()
+        for _, image in iter_page_images(fname, page_numbers, dpi):
+            rasterize_time += time.perf_counter() - start
+            start = time.perf_counter()
+            tesseract_image(image, dpi)
+            ocr_time += time.perf_counter() - start
+            start = time.perf_counter()
+    except Exception as e:
+        return {"file": fname, "output_type": "ocr", "error": "{}: {}".format(type(e).__name__, e)}
+    elapsed = rasterize_time + ocr_time
+    return {
+        "file": fname,
+        "output_type": "ocr",
+        "dpi": dpi,
+        "pages": len(page_numbers),
+        "elapsed": elapsed,
+        "pages_per_sec": len(page_numbers) / elapsed if elapsed else None,
+        "stages": {"rasterize": rasterize_time, "ocr": ocr_time},
+        "baseline_rss_kb": baseline_rss,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def read_syscalls() -> Optional[int]:
+    """Read syscalls of this process so far, None where /proc/self/io is
+    missing (not Linux)."""
+    try:
+        with open("/proc/self/io") as fp:
+            for line in fp:
+                if line.startswith("syscr:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_mmap_case(fname: str, use_mmap: bool, repeat: int) -> Dict[str, Any]:
+    """Runs in a fresh worker process. Time the reads of fname that do not
+    depend on layout analysis, hashing it for the extraction cache and
+    parsing its page tree for --split-pages, through open_pdf with and
+    without use_mmap, and count the read syscalls of each. Pages of the
+    mapping count toward the RSS once they are touched."""
+    baseline_rss = peak_rss_kb()
+    stages: Dict[str, Dict[str, Any]] = {}
+    for stage, func in (
+        ("sha256", lambda: file_sha256(fname, use_mmap)),
+        ("count_pages", lambda: count_pages(fname, use_mmap=use_mmap)),
+    ):
+        timings = []
+        syscalls = []
+        for _ in range(repeat):
+            before = read_syscalls()
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+            after = read_syscalls()
+            if before is not None and after is not None:
+                syscalls.append(after - before)
+        stages[stage] = {
+            "elapsed": min(timings),
+            "median_elapsed": statistics.median(timings),
+            "read_syscalls": min(syscalls) if syscalls else None,
+        }
+    elapsed = sum(stage["elapsed"] for stage in stages.values())
+    return {
+        "file": fname,
+        "output_type": "mmap" if use_mmap else "read",
+        "file_bytes": os.path.getsize(fname),
+        "pages": count_pages(fname),
+        "elapsed": elapsed,
+        "pages_per_sec": None,
+        "mb_per_sec": os.path.getsize(fname) / elapsed / 1e6 if elapsed else None,
+        "stages": stages,
+        "baseline_rss_kb": baseline_rss,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def run_jobs_case(
+    files: List[str], jobs: int, split_pages: bool, repeat: int
+) -> Dict[str, Any]:
+    """Extract all files to text the way pdf2txt --jobs does, whole files or
+    with --split-pages page chunks per process. One job is the serial loop
+    pdf2txt runs without --jobs. The peak RSS is that of the largest worker
+    process."""
+    options = dict(
+        output_type="text",
+        codec="utf-8",
+        laparams=LAParams(),
+        maxpages=0,
+        page_numbers=None,
+        password="",
+        scale=1.0,
+        rotation=0,
+        layoutmode="normal",
+        output_dir=None,
+        strip_control=False,
+        debug=False,
+        disable_caching=False,
+        use_mmap=False,
+        fast=False,
+    )
+    timings = []
+    for _ in range(repeat):
+        outfp = io.BytesIO()
+        start = time.perf_counter()
+        if jobs > 1:
+            # the per task timing lines of extract_files_parallel
+            with contextlib.redirect_stderr(io.StringIO()):
+                extract_files_parallel(files, outfp, jobs, options, split_pages)
+        else:
+            for fname in files:
+                extract_to_fp(fname, outfp, options)
+        timings.append(time.perf_counter() - start)
+    pages = sum(count_pages(fname) for fname in files)
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == "darwin":
+        children_rss //= 1024
+    return {
+        "file": "{} files".format(len(files)),
+        "output_type": "text",
+        "jobs": jobs,
+        "split_pages": split_pages,
+        "pages": pages,
+        "output_bytes": len(outfp.getvalue()),
+        "elapsed": min(timings),
+        "median_elapsed": statistics.median(timings),
+        "pages_per_sec": pages / min(timings) if min(timings) else None,
+        "peak_rss_kb": max(peak_rss_kb(), children_rss),
+    }
+
+
+def run_isolated(func: Any, *args: Any) -> Dict[str, Any]:
+    """Run func in a new process, forked processes would inherit the peak
+    RSS of this one."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return cast(Dict[str, Any], executor.submit(func, *args).result())
+
+
+def case_name(case: Dict[str, Any]) -> str:
+    if "jobs" in case:
+        return "jobs:{}:{}".format(
+            "split_pages" if case["split_pages"] else "files", case["jobs"]
+        )
+    return "{}:{}:{}".format(
+        os.path.basename(case["file"]), case["output_type"], case.get("laparams", "")
+    )
+
+
+def compare(cases: List[Dict[str, Any]], baseline_fname: str) -> None:
+    """Print pages/sec and peak RSS of each case relative to a baseline
+    result, to stderr."""
+    with open(baseline_fname) as fp:
+        baseline = {case_name(case): case for case in json.load(fp)["cases"]}
+    for case in cases:
+        before = baseline.get(case_name(case))
+        if not before or not before.get("pages_per_sec") or not case.get("pages_per_sec"):
+            continue
+        print(
+            "{:<48} {:>9.1f} pages/s {:+7.1%}  peak RSS {:+7.1%}".format(
+                case_name(case),
+                case["pages_per_sec"],
+                case["pages_per_sec"] / before["pages_per_sec"] - 1,
+                case["peak_rss_kb"] / before["peak_rss_kb"] - 1,
+            ),
+            file=sys.stderr,
+        )
+
+
+def comma_separated(value: str) -> List[str]:
+    return [item for item in value.split(",") if item]
+
+
+def parse_args(args: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, add_help=True)
+    parser.add_argument(
+        "files",
+        type=str,
+        nargs="*",
+        help="PDF files to benchmark besides the synthetic ones, defaults to "
+        "abc.pdf next to this script.",
+    )
+    parser.add_argument(
+        "--synthetic-pages",
+        type=lambda value: [int(pages) for pages in comma_separated(value)],
+        default=list(SYNTHETIC_PAGE_COUNTS),
+        help="Page counts of the generated PDFs, comma separated, empty for none.",
+    )
+    parser.add_argument(
+        "--output-types",
+        type=comma_separated,
+        default=list(OUTPUT_TYPES),
+        help="Output types to benchmark, comma separated.",
+    )
+    parser.add_argument(
+        "--laparams",
+        type=comma_separated,
+        default=list(LAPARAMS_PROFILES),
+        help="Layout profiles to benchmark, comma separated, out of {}.".format(
+            ", ".join(LAPARAMS_PROFILES)
+        ),
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per case, the fastest is reported."
+    )
+    parser.add_argument(
+        "--ocr",
+        action="store_true",
+        help="Also benchmark rasterizing and OCR, needs poppler and tesseract.",
+    )
+    parser.add_argument(
+        "--ocr-pages", type=int, default=2, help="Pages per file to OCR."
+    )
+    parser.add_argument("--dpi", type=int, default=300, help="OCR resolution.")
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="Also benchmark open_pdf with and without use_mmap on a large "
+        "generated pdf.",
+    )
+    parser.add_argument(
+        "--mmap-pages",
+        type=int,
+        default=MMAP_PAGE_COUNT,
+        help="Page count of the generated pdf of --mmap.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=lambda value: [int(jobs) for jobs in comma_separated(value)],
+        default=[],
+        help="Also benchmark pdf2txt --jobs on all files with these process "
+        "counts, comma separated, e.g. 1,2,4.",
+    )
+    parser.add_argument(
+        "--outfile", "-o", type=str, default="-", help="Where to write the JSON result."
+    )
+    parser.add_argument(
+        "--baseline", type=str, help="Earlier JSON result to compare against."
+    )
+    parsed_args = parser.parse_args(args=args)
+
+    for output_type in parsed_args.output_types:
+        if output_type not in OUTPUT_TYPES:
+            parser.error("unknown output type: {}".format(output_type))
+    for profile in parsed_args.laparams:
+        if profile not in LAPARAMS_PROFILES:
+            parser.error("unknown layout profile: {}".format(profile))
+    if not parsed_args.files:
+        default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "abc.pdf")
+        if os.path.exists(default):
+            parsed_args.files = [default]
+    return parsed_args
+
+
+def iter_cases(
+    files: List[str], output_types: List[str], profiles: List[str]
+) -> List[Tuple[str, str, str]]:
+    cases = []
+    for fname in files:
+        for output_type in output_types:
+            # the tag output does no layout analysis
+            for profile in ["none"] if output_type == "tag" else profiles:
+                cases.append((fname, output_type, profile))
+    return cases
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parsed_args = parse_args(args)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = list(parsed_args.files)
+        for pages in parsed_args.synthetic_pages:
+            fname = os.path.join(tmpdir, "synthetic-{}.pdf".format(pages))
+            make_synthetic_pdf(fname, pages)
+            files.append(fname)
+        if not files:
+            raise ValueError("Must provide files to work upon!")
+
+        cases = []
+        for fname, output_type, profile in iter_cases(
+            files, parsed_args.output_types, parsed_args.laparams
+        ):
+            case = run_isolated(
+                run_extraction_case, fname, output_type, profile, parsed_args.repeat
+            )
+            print(
+                "{:<48} {:>9.1f} pages/s".format(case_name(case), case["pages_per_sec"] or 0),
+                file=sys.stderr,
+            )
+            cases.append(case)
+        for split_pages in (False, True) if parsed_args.jobs else ():
+            serial = None
+            for jobs in parsed_args.jobs:
+                case = run_isolated(
+                    run_jobs_case, files, jobs, split_pages, parsed_args.repeat
+                )
+                if jobs == 1:
+                    serial = case
+                # against the serial loop, when 1 is among the job counts
+                case["speedup"] = serial["elapsed"] / case["elapsed"] if serial else None
+                print(
+                    "{:<48} {:>9.1f} pages/s  x{:.2f}".format(
+                        case_name(case), case["pages_per_sec"] or 0, case["speedup"] or 0
+                    ),
+                    file=sys.stderr,
+                )
+                cases.append(case)
+        if parsed_args.mmap:
+            fname = os.path.join(tmpdir, "synthetic-{}.pdf".format(parsed_args.mmap_pages))
+            if not os.path.exists(fname):
+                make_synthetic_pdf(fname, parsed_args.mmap_pages)
+            for use_mmap in (False, True):
+                case = run_isolated(run_mmap_case, fname, use_mmap, parsed_args.repeat)
+                print(
+                    "{:<48} {:>9.1f} MB/s  {} read syscalls  peak RSS {} kB".format(
+                        case_name(case),
+                        case["mb_per_sec"] or 0,
+                        sum(stage["read_syscalls"] or 0 for stage in case["stages"].values()),
+                        case["peak_rss_kb"],
+                    ),
+                    file=sys.stderr,
+                )
+                cases.append(case)
+        if parsed_args.ocr:
+            for fname in files:
+                cases.append(
+                    run_isolated(run_ocr_case, fname, parsed_args.ocr_pages, parsed_args.dpi)
+                )
+
+    result = {
+        "environment": {
+            "python": platform.python_version(),
+            "pdfminer": pdfminer.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "repeat": parsed_args.repeat,
+        "cases": cases,
+    }
+    if parsed_args.outfile == "-":
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(parsed_args.outfile, "w") as fp:
+            json.dump(result, fp, indent=2)
+    if parsed_args.baseline:
+        compare(cases, parsed_args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
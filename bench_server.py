@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""Load test the todo API under gunicorn (demo.wsgi, as in Procfile.txt) and
+under uvicorn (demo.asgi, with the async endpoints of /todo/async/todo/).
+
+Both servers run against the same scratch SQLite database, filled by
+bench_todo.py, with the API cache off so every request reaches the database.
+Each endpoint is loaded at several concurrency levels by client threads with
+keep-alive connections, the clients share the CPUs with the server, so
+compare the two servers on the same machine rather than absolute numbers.
+Results are written as JSON, pass an earlier result as --baseline to compare.
+Needs gunicorn and uvicorn installed."""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import django
+
+import bench_todo
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CONCURRENCY = (1, 10, 50)
+
+SERVERS: Dict[str, Callable[[int, int], List[str]]] = {
+    "wsgi": lambda port, workers: [
+        sys.executable, "-m", "gunicorn", "demo.wsgi",
+        "--bind", "127.0.0.1:{}".format(port),
+        "--workers", str(workers),
+        "--log-level", "warning",
+    ],
+    "asgi": lambda port, workers: [
+        sys.executable, "-m", "uvicorn", "demo.asgi:application",
+        "--host", "127.0.0.1",
+        "--port", str(port),
+        "--workers", str(workers),
+        "--log-level", "warning",
+    ],
+}
+
+# the request of each endpoint by server, gunicorn serves the DRF views and
+# uvicorn the async views; {id} is a random todo id
+ENDPOINTS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "list": {
+        "wsgi": ("GET", "/todo/todo/?page_size=50"),
+        "asgi": ("GET", "/todo/async/todo/?page_size=50"),
+    },
+    "detail": {
+        "wsgi": ("GET", "/todo/todo/{id}/"),
+        "asgi": ("GET", "/todo/async/todo/{id}/"),
+    },
+    "create": {
+        "wsgi": ("POST", "/todo/todo/"),
+        "asgi": ("POST", "/todo/async/todo/"),
+    },
+}
+CREATE_BODY = json.dumps(
+    {
+        "todo_tile": "load test",
+        "todo_description": "created by bench_server.py",
+        "todo_creation": "2022-05-03T10:00:00Z",
+    }
+)
+
+# the servers import this instead of demo.settings
+SETTINGS_TEMPLATE = """
+from demo.settings import *
+
+DATABASES["default"]["NAME"] = {db_path!r}
+CACHES = {{"default": {{"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}}}
+DEBUG = False
+"""
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def start_server(server: str, port: int, workers: int, settings_dir: str) -> subprocess.Popen:
+    """Start server and wait until it answers."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([settings_dir, REPO_DIR, env.get("PYTHONPATH", "")])
+    env["DJANGO_SETTINGS_MODULE"] = "bench_server_settings"
+    process = subprocess.Popen(SERVERS[server](port, workers), cwd=REPO_DIR, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("{} exited with {}".format(server, process.returncode))
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/todo/async/todo/?page_size=1")
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("{} did not start on port {}".format(server, port))
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def percentile(timings: List[float], share: float) -> float:
+    return timings[min(int(len(timings) * share), len(timings) - 1)]
+
+
+def load(
+    port: int, method: str, url: str, concurrency: int, duration: float, rows: int
+) -> Dict[str, Any]:
+    """Send requests from concurrency threads for duration seconds, each
+    thread waits for its response before the next request."""
+    timings: List[float] = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    headers = {"Accept": "application/json", "Content-Type": "application/json"}
+
+    def client(seed: int) -> None:
+        rnd = random.Random(seed)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        own_timings = []
+        own_errors = []
+        while time.monotonic() < deadline:
+            body = CREATE_BODY if method == "POST" else None
+            start = time.perf_counter()
+            try:
+                connection.request(method, url.format(id=rnd.randint(1, rows)), body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    own_errors.append(str(response.status))
+            except (OSError, http.client.HTTPException) as e:
+                own_errors.append(type(e).__name__)
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                continue
+            own_timings.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            timings.extend(own_timings)
+            errors.extend(own_errors)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        "requests": len(timings),
+        "errors": len(errors),
+        "error_kinds": sorted(set(errors)),
+        "requests_per_sec": len(timings) / elapsed,
+        "p50_ms": percentile(timings, 0.5) * 1000 if timings else None,
+        "p95_ms": percentile(timings, 0.95) * 1000 if timings else None,
+        "p99_ms": percentile(timings, 0.99) * 1000 if timings else None,
+    }
+
+
+def run_server_case(
+    server: str, parsed_args: argparse.Namespace, settings_dir: str, rows: int
+) -> List[Dict[str, Any]]:
+    port = get_free_port()
+    process = start_server(server, port, parsed_args.workers, settings_dir)
+    results = []
+    try:
+        for endpoint in parsed_args.endpoints:
+            method, url = ENDPOINTS[endpoint][server]
+            for concurrency in parsed_args.concurrency:
+                result = {
+                    "name": "{}:{}:c{}".format(server, endpoint, concurrency),
+                    "method": method,
+                    "url": url,
+                }
+                result.update(load(port, method, url, concurrency, parsed_args.duration, rows))
+                print(
+                    "{:<24} {:>8.1f} req/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms  errors {}".format(
+                        result["name"],
+                        result["requests_per_sec"],
+                        result["p50_ms"] or 0,
+                        result["p99_ms"] or 0,
+                        result["errors"],
+                    ),
+                    file=sys.stderr,
+                )
+                results.append(result)
+    finally:
+        stop_server(process)
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline_fname: str) -> None:
+    """Print requests/sec and p99 latency of each result relative to a
+    baseline result, to stderr."""
+    with open(baseline_fname) as fp:
+        baseline = {result["name"]: result for result in json.load(fp)["results"]}
+    for result in results:
+        before = baseline.get(result["name"])
+        if not before or not before.get("requests_per_sec") or not result.get("p99_ms"):
+            continue
+        print(
+            "{:<24} {:>8.1f} req/s {:+7.1%}  p99 {:+7.1%}".format(
+                result["name"],
+                result["requests_per_sec"],
+                result["requests_per_sec"] / before["requests_per_sec"] - 1,
+                result["p99_ms"] / before["p99_ms"] - 1,
+            ),
+            file=sys.stderr,
+        )
+
+
+def parse_args(args: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, add_help=True)
+    parser.add_argument(
+        "--servers",
+        type=bench_todo.comma_separated,
+        default=list(SERVERS),
+        help="Servers to load, comma separated, out of {}.".format(", ".join(SERVERS)),
+    )
+    parser.add_argument(
+        "--endpoints",
+        type=bench_todo.comma_separated,
+        default=list(ENDPOINTS),
+        help="Endpoints to load, comma separated, out of {}.".format(", ".join(ENDPOINTS)),
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(level) for level in bench_todo.comma_separated(value)],
+        default=list(CONCURRENCY),
+        help="Concurrent clients, comma separated.",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10, help="Seconds of load per endpoint and concurrency."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Server worker processes, Procfile.txt runs one."
+    )
+    parser.add_argument(
+        "--rows", type=int, default=100000, help="Todos in the database."
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        help="SQLite file to fill and keep, a temporary one is used otherwise.",
+    )
+    parser.add_argument(
+        "--outfile", "-o", type=str, default="-", help="Where to write the JSON result."
+    )
+    parser.add_argument(
+        "--baseline", type=str, help="Earlier JSON result to compare against."
+    )
+    parsed_args = parser.parse_args(args=args)
+    for server in parsed_args.servers:
+        if server not in SERVERS:
+            parser.error("unknown server: {}".format(server))
+    for endpoint in parsed_args.endpoints:
+        if endpoint not in ENDPOINTS:
+            parser.error("unknown endpoint: {}".format(endpoint))
+    return parsed_args
+
+
+def run(parsed_args: argparse.Namespace, tmpdir: str) -> Dict[str, Any]:
+    db_path = os.path.abspath(parsed_args.db) if parsed_args.db else os.path.join(tmpdir, "bench.sqlite3")
+    bench_todo.setup_django(db_path)
+    start = time.perf_counter()
+    rows = bench_todo.populate(parsed_args.rows)
+    print("{} todos ready in {:.1f}s".format(rows, time.perf_counter() - start), file=sys.stderr)
+    with open(os.path.join(tmpdir, "bench_server_settings.py"), "w") as fp:
+        fp.write(SETTINGS_TEMPLATE.format(db_path=db_path))
+
+    results = []
+    for server in parsed_args.servers:
+        results.extend(run_server_case(server, parsed_args, tmpdir, rows))
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sqlite_profile": os.environ.get("DJANGO_SQLITE_PROFILE", "default"),
+        },
+        "rows": rows,
+        "workers": parsed_args.workers,
+        "duration": parsed_args.duration,
+        "results": results,
+    }
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parsed_args = parse_args(args)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        result = run(parsed_args, tmpdir)
+
+    if parsed_args.outfile == "-":
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(parsed_args.outfile, "w") as fp:
+            json.dump(result, fp, indent=2)
+    if parsed_args.baseline:
+        compare(result["results"], parsed_args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""Benchmark several processes writing and reading one SQLite database, with
+the default sqlite3 backend and with DJANGO_SQLITE_PROFILE=concurrent.
+
+Writer processes run atomic transactions that count the todos and then add
+one, the read-then-write pattern that fails with "database is locked" when
+another process holds the write lock. Reader processes read a page of todos
+at the same time. Every profile gets a fresh database filled by
+bench_todo.py. Results are written as JSON, pass an earlier result as
+--baseline to compare."""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import django
+
+import bench_todo
+
+PROFILES = ("default", "concurrent")
+
+
+def percentile(timings: List[float], share: float) -> float:
+    return timings[min(int(len(timings) * share), len(timings) - 1)]
+
+
+def setup_django(profile: str, db_path: str) -> None:
+    """Select profile before Django reads the settings."""
+    if profile == "default":
+        os.environ.pop("DJANGO_SQLITE_PROFILE", None)
+    else:
+        os.environ["DJANGO_SQLITE_PROFILE"] = profile
+    bench_todo.setup_django(db_path)
+
+
+def populate(profile: str, db_path: str, rows: int) -> None:
+    setup_django(profile, db_path)
+    bench_todo.populate(rows)
+
+
+def worker(
+    profile: str, db_path: str, role: str, count: int, barrier: Any, queue: Any
+) -> None:
+    """Run count write transactions or reads once every process is ready and
+    put the timings and errors on queue."""
+    setup_django(profile, db_path)
+    from django.db import OperationalError, transaction
+
+    from todo.api.serializers import TodoReadSerializer
+    from todo.models import Todo
+
+    def write() -> None:
+        with transaction.atomic():
+            Todo.objects.count()
+            Todo.objects.create(
+                todo_tile="bench", todo_description="bench_sqlite.py", todo_creation="2022-05-03T10:00:00Z"
+            )
+
+    def read() -> None:
+        list(Todo.objects.order_by("-id").values_list(*TodoReadSerializer.fields)[:50])
+
+    func = write if role == "write" else read
+    timings = []
+    errors: Dict[str, int] = {}
+    barrier.wait()
+    start = time.perf_counter()
+    for _ in range(count):
+        call_start = time.perf_counter()
+        try:
+            func()
+        except OperationalError as e:
+            errors[str(e)] = errors.get(str(e), 0) + 1
+            continue
+        timings.append(time.perf_counter() - call_start)
+    queue.put(
+        {"role": role, "elapsed": time.perf_counter() - start, "timings": timings, "errors": errors}
+    )
+
+
+def run_profile(profile: str, parsed_args: argparse.Namespace, tmpdir: str) -> Dict[str, Any]:
+    db_path = os.path.join(tmpdir, "{}.sqlite3".format(profile))
+    context = multiprocessing.get_context("spawn")
+    setup = context.Process(target=populate, args=(profile, db_path, parsed_args.rows))
+    setup.start()
+    setup.join()
+
+    roles = ["write"] * parsed_args.writers + ["read"] * parsed_args.readers
+    barrier = context.Barrier(len(roles))
+    queue = context.Queue()
+    processes = [
+        context.Process(
+            target=worker,
+            args=(
+                profile,
+                db_path,
+                role,
+                parsed_args.transactions if role == "write" else parsed_args.reads,
+                barrier,
+                queue,
+            ),
+        )
+        for role in roles
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    result: Dict[str, Any] = {"name": profile}
+    for role in ("write", "read"):
+        role_outcomes = [outcome for outcome in outcomes if outcome["role"] == role]
+        if not role_outcomes:
+            continue
+        timings = sorted(timing for outcome in role_outcomes for timing in outcome["timings"])
+        errors: Dict[str, int] = {}
+        for outcome in role_outcomes:
+            for error, count in outcome["errors"].items():
+                errors[error] = errors.get(error, 0) + count
+        elapsed = max(outcome["elapsed"] for outcome in role_outcomes)
+        result[role] = {
+            "processes": len(role_outcomes),
+            "done": len(timings),
+            "errors": errors,
+            "elapsed_s": elapsed,
+            "per_sec": len(timings) / elapsed,
+            "p50_ms": percentile(timings, 0.5) * 1000 if timings else None,
+            "p99_ms": percentile(timings, 0.99) * 1000 if timings else None,
+        }
+    return result
+
+
+def describe(result: Dict[str, Any], role: str) -> str:
+    stats = result.get(role)
+    if not stats:
+        return ""
+    return "{}: {:>7.1f}/s p99 {:>8.2f} ms errors {:>5}".format(
+        role, stats["per_sec"], stats["p99_ms"] or 0, sum(stats["errors"].values())
+    )
+
+
+def compare(results: List[Dict[str, Any]], baseline_fname: str) -> None:
+    """Print writes and reads per second of each profile relative to a
+    baseline result, to stderr."""
+    with open(baseline_fname) as fp:
+        baseline = {result["name"]: result for result in json.load(fp)["results"]}
+    for result in results:
+        before = baseline.get(result["name"], {})
+        for role in ("write", "read"):
+            if before.get(role, {}).get("per_sec") and result.get(role):
+                print(
+                    "{:<12} {:<6} {:>8.1f}/s {:+7.1%}".format(
+                        result["name"],
+                        role,
+                        result[role]["per_sec"],
+                        result[role]["per_sec"] / before[role]["per_sec"] - 1,
+                    ),
+                    file=sys.stderr,
+                )
+
+
+def parse_args(args: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, add_help=True)
+    parser.add_argument(
+        "--profiles",
+        type=bench_todo.comma_separated,
+        default=list(PROFILES),
+        help="SQLite profiles to run, comma separated, out of {}.".format(", ".join(PROFILES)),
+    )
+    parser.add_argument(
+        "--writers", type=int, default=8, help="Writing processes."
+    )
+    parser.add_argument(
+        "--readers", type=int, default=4, help="Reading processes."
+    )
+    parser.add_argument(
+        "--transactions", type=int, default=200, help="Write transactions per writer."
+    )
+    parser.add_argument(
+        "--reads", type=int, default=500, help="Page reads per reader."
+    )
+    parser.add_argument(
+        "--rows", type=int, default=10000, help="Todos in the database to start with."
+    )
+    parser.add_argument(
+        "--outfile", "-o", type=str, default="-", help="Where to write the JSON result."
+    )
+    parser.add_argument(
+        "--baseline", type=str, help="Earlier JSON result to compare against."
+    )
+    parsed_args = parser.parse_args(args=args)
+    for profile in parsed_args.profiles:
+        if profile not in PROFILES:
+            parser.error("unknown profile: {}".format(profile))
+    return parsed_args
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parsed_args = parse_args(args)
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for profile in parsed_args.profiles:
+            result = run_profile(profile, parsed_args, tmpdir)
+            print(
+                "{:<12} {}  {}".format(profile, describe(result, "write"), describe(result, "read")),
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    result = {
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "writers": parsed_args.writers,
+        "readers": parsed_args.readers,
+        "transactions": parsed_args.transactions,
+        "reads": parsed_args.reads,
+        "results": results,
+    }
+    if parsed_args.outfile == "-":
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(parsed_args.outfile, "w") as fp:
+            json.dump(result, fp, indent=2)
+    if parsed_args.baseline:
+        compare(results, parsed_args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
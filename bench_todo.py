@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Benchmark the todo API read paths on a scratch SQLite database.
+
+The database is migrated and filled with generated todos first, pass --db to
+keep it between runs, filling a million rows takes a while. The API cache is
+switched off, so every request reaches the database. Results are written as
+JSON, pass an earlier result as --baseline to compare."""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import django
+from django.conf import settings
+
+SYLLABLES = ("ba", "ko", "ri", "mu", "te", "sa", "lo", "ni", "pe", "du", "ga", "vi")
+VOCABULARY_SIZE = 5000
+# search queries by the frequency rank of their words, so they range from
+# matching a good share of the rows to matching none
+SEARCH_QUERY_RANKS = {
+    "common": [0],
+    "common_prefix": [0],
+    "two_common": [0, 1],
+    "mid": [100],
+    "rare": [2000],
+    "rare_prefix": [2000],
+    "common_and_rare": [0, 2000],
+}
+SERIALIZER_ROWS = (50, 500, 5000)
+# how far into the table each page starts, as a share of the rows
+PAGE_DEPTHS = (0, 0.01, 0.1, 0.5, 0.9, 0.99)
+PAGE_SIZE = 50
+POPULATE_BATCH_SIZE = 5000
+
+
+def make_vocabulary(size: int = VOCABULARY_SIZE, seed: int = 0) -> List[str]:
+    """Distinct made up words, the first is the most frequent."""
+    rnd = random.Random(seed)
+    words: Dict[str, None] = {}
+    while len(words) < size:
+        words["".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))] = None
+    return list(words)
+
+
+def zipf_cum_weights(size: int) -> List[float]:
+    weights = []
+    total = 0.0
+    for rank in range(size):
+        total += 1 / (rank + 1)
+        weights.append(total)
+    return weights
+
+
+def get_search_queries(vocabulary: List[str]) -> Dict[str, str]:
+    queries = {}
+    for name, ranks in SEARCH_QUERY_RANKS.items():
+        words = [vocabulary[rank] for rank in ranks]
+        if name.endswith("_prefix"):
+            words = [word[:3] for word in words]
+        queries[name] = " ".join(words)
+    queries["miss"] = "zzz"
+    return queries
+
+
+def setup_django(db_path: str) -> None:
+    """Point the default database at db_path and turn the API cache off,
+    before Django is set up."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "demo.settings")
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    django.setup()
+
+
+def populate(rows: int, seed: int = 0) -> int:
+    """Migrate the database and add generated todos until it holds rows of
+    them. The same seed gives the same rows."""
+    from django.core.management import call_command
+
+    from todo.models import Todo
+
+    call_command("migrate", verbosity=0)
+    existing = Todo.objects.count()
+    rnd = random.Random(seed + existing)
+    vocabulary = make_vocabulary()
+    cum_weights = zipf_cum_weights(len(vocabulary))
+
+    def words(count: int) -> str:
+        return " ".join(rnd.choices(vocabulary, cum_weights=cum_weights, k=count))
+
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    for offset in range(existing, rows, POPULATE_BATCH_SIZE):
+        Todo.objects.bulk_create(
+            [
+                Todo(
+                    todo_tile=words(2)[:20],
+                    todo_description=words(12),
+                    todo_creation=start + timedelta(seconds=rnd.randrange(10 ** 8)),
+                )
+                for _ in range(min(POPULATE_BATCH_SIZE, rows - offset))
+            ]
+        )
+    return Todo.objects.count()
+
+
+def time_calls(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "min_ms": timings[0] * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000,
+    }
+
+
+def run_search_case(repeat: int) -> List[Dict[str, Any]]:
+    """The FTS5 search of /todo/todo/search/ against the icontains filter it
+    replaced. FTS ranks every match, icontains stops at the 50 newest, so the
+    comparison depends on how many rows a query matches, the queries range
+    from common words to a miss."""
+    from todo.models import Todo
+    from todo.search import get_search_terms, search_todo_ids, search_todo_ids_icontains
+
+    results = []
+    for name, query in get_search_queries(make_vocabulary()).items():
+        terms = get_search_terms(query)
+        fts = time_calls(lambda: search_todo_ids(query, 50), repeat)
+        icontains = time_calls(lambda: search_todo_ids_icontains(terms, 50), repeat)
+        results.append(
+            {
+                "name": "search:{}".format(name),
+                "query": query,
+                "matches": len(search_todo_ids(query, Todo.objects.count())),
+                "fts": fts,
+                "icontains": icontains,
+                "speedup": icontains["median_ms"] / fts["median_ms"] if fts["median_ms"] else None,
+            }
+        )
+    return results
+
+
+def run_serializer_case(repeat: int) -> List[Dict[str, Any]]:
+    """The list read path, queryset to JSON bytes, of TodoSerializer and the
+    ?serializer=fast values_list() path, for a few row counts. orjson is used
+    by the fast path when it is installed."""
+    from rest_framework.renderers import JSONRenderer
+
+    from todo.api.renderers import FastJSONRenderer, orjson
+    from todo.api.serializers import TodoReadSerializer, TodoSerializer
+    from todo.models import Todo
+
+    results = []
+    for rows in SERIALIZER_ROWS:
+        queryset = Todo.objects.order_by("id")[:rows]
+        default = time_calls(
+            lambda: JSONRenderer().render(TodoSerializer(queryset.all(), many=True).data), repeat
+        )
+        fast = time_calls(
+            lambda: FastJSONRenderer().render(
+                TodoReadSerializer(queryset.values_list(*TodoReadSerializer.fields)).data
+            ),
+            repeat,
+        )
+        results.append(
+            {
+                "name": "serializer:{}".format(rows),
+                "orjson": orjson is not None,
+                "default": default,
+                "fast": fast,
+                "default_rows_per_sec": rows / default["median_ms"] * 1000,
+                "fast_rows_per_sec": rows / fast["median_ms"] * 1000,
+            }
+        )
+    return results
+
+
+def run_pagination_case(repeat: int) -> List[Dict[str, Any]]:
+    """A list page of /todo/todo/ at several depths, through TodoCursorPagination
+    and through LimitOffsetPagination on the same view. The cursor seeks to its
+    position on the todo_creation index, the offset has to step over every row
+    before the page, so only the cursor page stays flat with depth."""
+    from rest_framework.pagination import Cursor, LimitOffsetPagination
+    from rest_framework.test import APIRequestFactory
+
+    from todo.api.pagination import TodoCursorPagination
+    from todo.api.views import TodoViewSet
+    from todo.models import Todo
+
+    factory = APIRequestFactory(HTTP_ACCEPT="application/json")
+    cursor_view = TodoViewSet.as_view({"get": "list"})
+    offset_view = TodoViewSet.as_view({"get": "list"}, pagination_class=LimitOffsetPagination)
+    paginator = TodoCursorPagination()
+    paginator.base_url = "/todo/todo/?page_size={}".format(PAGE_SIZE)
+    ordered = Todo.objects.order_by(*TodoCursorPagination.ordering)
+    rows = ordered.count()
+
+    def get_page(view: Callable, url: str) -> bytes:
+        response = view(factory.get(url))
+        assert response.status_code == 200, response.status_code
+        return response.render().content
+
+    results = []
+    for depth in PAGE_DEPTHS:
+        offset = min(int(rows * depth), max(rows - PAGE_SIZE, 0))
+        if offset:
+            # the next link of the page before holds the position of its last row
+            position = str(ordered.values_list("todo_creation", flat=True)[offset - 1])
+            cursor_url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+        else:
+            cursor_url = paginator.base_url
+        offset_url = "/todo/todo/?limit={}&offset={}".format(PAGE_SIZE, offset)
+        cursor = time_calls(lambda: get_page(cursor_view, cursor_url), repeat)
+        offset_page = time_calls(lambda: get_page(offset_view, offset_url), repeat)
+        results.append(
+            {
+                "name": "pagination:{:g}%".format(depth * 100),
+                "offset": offset,
+                "cursor": cursor,
+                "limit_offset": offset_page,
+                "speedup": offset_page["median_ms"] / cursor["median_ms"] if cursor["median_ms"] else None,
+            }
+        )
+    return results
+
+
+CASES: Dict[str, Callable[[int], List[Dict[str, Any]]]] = {
+    "pagination": run_pagination_case,
+    "search": run_search_case,
+    "serializer": run_serializer_case,
+}
+
+
+def summary(result: Dict[str, Any]) -> Dict[str, float]:
+    """The median of each timed path of a result, by path."""
+    return {
+        path: timing["median_ms"]
+        for path, timing in result.items()
+        if isinstance(timing, dict) and "median_ms" in timing
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_fname: str) -> None:
+    """Print the median of every path relative to a baseline result, to stderr."""
+    with open(baseline_fname) as fp:
+        baseline = {result["name"]: result for result in json.load(fp)["results"]}
+    for result in results:
+        before = summary(baseline.get(result["name"], {}))
+        for path, median in summary(result).items():
+            if before.get(path):
+                print(
+                    "{:<40} {:<10} {:>9.2f} ms {:+7.1%}".format(
+                        result["name"], path, median, median / before[path] - 1
+                    ),
+                    file=sys.stderr,
+                )
+
+
+def comma_separated(value: str) -> List[str]:
+    return [item for item in value.split(",") if item]
+
+
+def parse_args(args: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, add_help=True)
+    parser.add_argument(
+        "--cases",
+        type=comma_separated,
+        default=list(CASES),
+        help="Cases to run, comma separated, out of {}.".format(", ".join(CASES)),
+    )
+    parser.add_argument(
+        "--rows", type=int, default=100000, help="Todos in the database."
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        help="SQLite file to fill and keep, a temporary one is used otherwise.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Timed runs per path."
+    )
+    parser.add_argument(
+        "--outfile", "-o", type=str, default="-", help="Where to write the JSON result."
+    )
+    parser.add_argument(
+        "--baseline", type=str, help="Earlier JSON result to compare against."
+    )
+    parsed_args = parser.parse_args(args=args)
+    for case in parsed_args.cases:
+        if case not in CASES:
+            parser.error("unknown case: {}".format(case))
+    return parsed_args
+
+
+def run(parsed_args: argparse.Namespace, db_path: str) -> Dict[str, Any]:
+    setup_django(db_path)
+    start = time.perf_counter()
+    rows = populate(parsed_args.rows)
+    print("{} todos ready in {:.1f}s".format(rows, time.perf_counter() - start), file=sys.stderr)
+    results = []
+    for case in parsed_args.cases:
+        for result in CASES[case](parsed_args.repeat):
+            print(
+                "{:<40} {}".format(
+                    result["name"],
+                    "  ".join("{}: {:.2f} ms".format(path, median) for path, median in summary(result).items()),
+                ),
+                file=sys.stderr,
+            )
+            results.append(result)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "rows": rows,
+        "repeat": parsed_args.repeat,
+        "results": results,
+    }
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parsed_args = parse_args(args)
+    if parsed_args.db:
+        result = run(parsed_args, os.path.abspath(parsed_args.db))
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = run(parsed_args, os.path.join(tmpdir, "bench.sqlite3"))
+
+    if parsed_args.outfile == "-":
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(parsed_args.outfile, "w") as fp:
+            json.dump(result, fp, indent=2)
+    if parsed_args.baseline:
+        compare(result["results"], parsed_args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
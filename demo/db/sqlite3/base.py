@@ -0,0 +1,39 @@
+"""
+sqlite3 backend tuned for several gunicorn workers sharing one database file
+
+enabled with DJANGO_SQLITE_PROFILE=concurrent, see DATABASES in demo/settings.py
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = (
+    # readers no longer block the writer and the writer no longer blocks readers
+    "PRAGMA journal_mode=WAL",
+    # with WAL only a checkpoint has to fsync, a commit stays durable unless the os crashes
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=20000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        """
+        take the write lock when the transaction starts, a deferred transaction that
+        reads and then writes can not be retried by busy_timeout and fails with
+        "database is locked" as soon as another worker is writing
+
+        this overrides a private hook of the Django 4.0 sqlite3 backend, not a public
+        api: BaseDatabaseWrapper.set_autocommit() calls it when atomic() opens a
+        transaction, and it can change or go away in any release. recheck it whenever
+        Django is upgraded, bench_sqlite.py reports the lock errors; from Django 5.1
+        OPTIONS["transaction_mode"] = "IMMEDIATE" does the same without it
+        """
+        self.cursor().execute("BEGIN IMMEDIATE")
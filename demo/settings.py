@@ -95,6 +95,19 @@ DATABASES = {
     }
 }
 
+# DJANGO_SQLITE_PROFILE=concurrent switches to the tuned backend in demo/db/sqlite3
+# (WAL, synchronous=NORMAL, mmap, busy timeout) and keeps connections open between
+# requests, for several gunicorn workers writing to the same database file.
+
+if os.environ.get('DJANGO_SQLITE_PROFILE') == 'concurrent':
+    DATABASES['default'].update({
+        'ENGINE': 'demo.db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+        'OPTIONS': {
+            'timeout': 20,
+        },
+    })
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -138,3 +151,26 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Rows per INSERT/UPDATE/DELETE statement in the bulk todo endpoints,
+# overridable per request with ?batch_size=
+
+TODO_BULK_BATCH_SIZE = 500
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Local memory by default, it evicts the least recently used entries once
+# MAX_ENTRIES is reached. Point DJANGO_CACHE_BACKEND at a shared backend
+# (e.g. memcached or redis) when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'todo-api'),
+        'TIMEOUT': int(os.environ.get('DJANGO_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_MAX_ENTRIES', 1000)),
+        },
+    }
+}
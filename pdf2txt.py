@@ -2,18 +2,66 @@
 """A command line tool for extracting text and images from PDF and
 output it to plain text, html, xml or tags."""
 import argparse
+import copy
+import hashlib
+import io
 import logging
+import mmap
+import os
+import re
+import string
 import sys
-from typing import Any, Container, Iterable, List, Optional
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    Any,
+    BinaryIO,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    cast,
+)
 
 import pdfminer.high_level
+from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
 from pdfminer.utils import AnyIO
 
 logging.basicConfig()
 
 OUTPUT_TYPES = ((".htm", "html"), (".html", "html"), (".xml", "xml"), (".tag", "tag"))
 
+# extract_text_to_fp options besides laparams and page_numbers that change the output
+CACHE_KEY_OPTIONS = (
+    "output_type",
+    "codec",
+    "maxpages",
+    "password",
+    "scale",
+    "rotation",
+    "layoutmode",
+    "strip_control",
+    "fast",
+)
+
+# --fast keeps a page laid out without advanced layout analysis only when at
+# least this share of its tokens look like words
+FAST_MIN_WORD_RATIO = 0.6
+# after this many pages where the full analysis was just as garbled (e.g. fonts
+# without a usable encoding) the rest of the document is not laid out twice
+FAST_MAX_USELESS_FALLBACKS = 2
+CID_RE = re.compile(r"\(cid:\d+\)")
+WORD_RE = re.compile(r"[^\W_]{2,20}|\d+|[aAI]")
+
 
 def float_or_disabled(x: str) -> Optional[float]:
     if x.lower().strip() == "disabled":
@@ -24,6 +72,390 @@ def float_or_disabled(x: str) -> Optional[float]:
         raise argparse.ArgumentTypeError("invalid float value: {}".format(x))
 
 
+@contextmanager
+def open_pdf(fname: str, use_mmap: bool = False) -> Iterator[BinaryIO]:
+    """Open fname for reading. With use_mmap the file is memory-mapped, the
+    parsers then seek and read straight from the page cache instead of
+    copying through a buffered file object. Empty files can not be mapped and
+    are opened normally."""
+    with open(fname, "rb") as fp:
+        if not use_mmap or os.fstat(fp.fileno()).st_size == 0:
+            yield fp
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield cast(BinaryIO, mapped)
+
+
+def looks_garbled(text: str) -> bool:
+    """If too few tokens of a page's text look like words. Glyphs without a
+    unicode mapping come out as (cid:N) whatever the layout analysis, they are
+    left out."""
+    tokens = [
+        token.strip(string.punctuation) for token in CID_RE.sub(" ", text).split()
+    ]
+    tokens = [token for token in tokens if token]
+    if not tokens:
+        return False
+    words = sum(1 for token in tokens if WORD_RE.fullmatch(token))
+    return words / len(tokens) < FAST_MIN_WORD_RATIO
+
+
+def fast_laparams(laparams: LAParams) -> LAParams:
+    """laparams with advanced layout analysis disabled, text boxes are ordered
+    by position instead of the quadratic grouping of boxes_flow"""
+    fast = copy.copy(laparams)
+    fast.boxes_flow = None
+    return fast
+
+
+def extract_to_fp(fname: str, outfp: AnyIO, options: Dict[str, Any]) -> None:
+    """extract_text_to_fp on fname, going page by page through iter_pages in
+    fast mode"""
+    fast = (
+        options["fast"]
+        and options["output_type"] == "text"
+        and options["laparams"] is not None
+        and not options["output_dir"]
+    )
+    if not fast:
+        with open_pdf(fname, options["use_mmap"]) as fp:
+            pdfminer.high_level.extract_text_to_fp(fp, outfp, **options)
+        return
+
+    pages = iter_pages(
+        fname,
+        options["laparams"],
+        options["page_numbers"],
+        options["maxpages"],
+        options["password"],
+        options["rotation"],
+        options["disable_caching"],
+        options["use_mmap"],
+        fast=True,
+    )
+    for _, text in pages:
+        text += "\f"
+        if isinstance(outfp, io.TextIOBase):
+            outfp.write(text)
+        else:
+            outfp.write(text.encode(options["codec"]))
+
+
+def extract_file(fname: str, options: Dict[str, Any]) -> Tuple[str, bytes, float]:
+    """Extract one file, or the pages of it selected in options, into memory.
+    Returns the file name, its encoded output and the seconds it took. Runs in
+    the worker processes of `--jobs`."""
+    start = time.perf_counter()
+    outfp = io.BytesIO()
+    extract_to_fp(fname, outfp, options)
+    return fname, outfp.getvalue(), time.perf_counter() - start
+
+
+def count_pages(fname: str, password: str = "", use_mmap: bool = False) -> int:
+    with open_pdf(fname, use_mmap) as fp:
+        doc = PDFDocument(PDFParser(fp), password=password)
+        return sum(1 for _ in PDFPage.create_pages(doc))
+
+
+def iter_pages(
+    fname: str,
+    laparams: Optional[LAParams] = None,
+    page_numbers: Optional[Container[int]] = None,
+    maxpages: int = 0,
+    password: str = "",
+    rotation: int = 0,
+    disable_caching: bool = False,
+    use_mmap: bool = False,
+    fast: bool = False,
+) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) for each selected page of fname as soon as
+    the page is laid out, so only one page of layout objects is alive at a
+    time. page_number is zero-indexed like page_numbers, pages are selected
+    like PDFPage.get_pages. The form feed ending each page is stripped, the
+    texts each followed by "\\f" make up the text output of extract_text.
+
+    With fast, pages are first laid out without advanced layout analysis and
+    only pages whose text looks garbled are laid out again with laparams,
+    until the full analysis has failed to help FAST_MAX_USELESS_FALLBACKS
+    times in the document."""
+    rsrcmgr = PDFResourceManager(caching=not disable_caching)
+    outfp = io.StringIO()
+    full_device = None
+    fallback = fast and laparams is not None
+    useless_fallbacks = 0
+    if fallback:
+        full_device = TextConverter(rsrcmgr, outfp, laparams=laparams)
+        full_interpreter = PDFPageInterpreter(rsrcmgr, full_device)
+        laparams = fast_laparams(laparams)
+    device = TextConverter(rsrcmgr, outfp, laparams=laparams)
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    try:
+        with open_pdf(fname, use_mmap) as fp:
+            doc = PDFDocument(PDFParser(fp), password=password, caching=not disable_caching)
+            for pageno, page in enumerate(PDFPage.create_pages(doc)):
+                if page_numbers and pageno not in page_numbers:
+                    continue
+                page.rotate = (page.rotate + rotation) % 360
+                interpreter.process_page(page)
+                text = outfp.getvalue()
+                outfp.seek(0)
+                outfp.truncate()
+                if fallback and looks_garbled(text):
+                    logging.info(
+                        "page %d looks garbled, using full layout analysis", pageno + 1
+                    )
+                    full_interpreter.process_page(page)
+                    text = outfp.getvalue()
+                    outfp.seek(0)
+                    outfp.truncate()
+                    if looks_garbled(text):
+                        useless_fallbacks += 1
+                        fallback = useless_fallbacks < FAST_MAX_USELESS_FALLBACKS
+                yield pageno, text[:-1] if text.endswith("\f") else text
+                if maxpages and maxpages <= pageno + 1:
+                    break
+    finally:
+        device.close()
+        if full_device is not None:
+            full_device.close()
+
+
+def split_page_range(
+    fname: str, jobs: int, options: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Split the pages of fname selected by page_numbers/maxpages into
+    contiguous chunks, returning the extraction options for each chunk.
+    Text output of the chunks concatenated in order is the output of the
+    whole document."""
+    page_numbers = options["page_numbers"]
+    maxpages = options["maxpages"]
+    # same selection as PDFPage.get_pages
+    pages = []
+    page_count = count_pages(fname, options["password"], options["use_mmap"])
+    for pageno in range(page_count):
+        if page_numbers and pageno not in page_numbers:
+            continue
+        pages.append(pageno)
+        if maxpages and maxpages <= pageno + 1:
+            break
+    if not pages:
+        return [options]
+    chunk_count = min(len(pages), jobs * 2)
+    chunk_size = -(-len(pages) // chunk_count)
+    return [
+        dict(options, page_numbers=set(pages[i : i + chunk_size]), maxpages=0)
+        for i in range(0, len(pages), chunk_size)
+    ]
+
+
+def describe_pages(options: Dict[str, Any]) -> str:
+    if not options["page_numbers"]:
+        return ""
+    pages = sorted(options["page_numbers"])
+    return " pages {}-{}".format(pages[0] + 1, pages[-1] + 1)
+
+
+def file_sha256(fname: str, use_mmap: bool = False) -> str:
+    digest = hashlib.sha256()
+    with open_pdf(fname, use_mmap) as fp:
+        if isinstance(fp, mmap.mmap):
+            digest.update(fp)
+        else:
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """On-disk cache of extraction output, keyed by the sha256 of the PDF
+    content plus every option that changes the output. Entries over max_bytes
+    are evicted least recently used first, a hit refreshes the entry mtime.
+
+    The size of the cache is scanned once and then kept as a running total,
+    the directory is only walked again when the total goes over max_bytes,
+    and eviction then goes down to EVICT_TO of it so that does not happen on
+    every put. Other processes writing to the same directory make the total
+    drift, each eviction scan sets it right."""
+
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes: Dict[str, str] = {}
+        self._total_bytes: Optional[int] = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def file_hash(self, fname: str, use_mmap: bool = False) -> str:
+        if fname not in self._file_hashes:
+            self._file_hashes[fname] = file_sha256(fname, use_mmap)
+        return self._file_hashes[fname]
+
+    def key(self, fname: str, options: Dict[str, Any]) -> str:
+        laparams = options["laparams"]
+        page_numbers = options["page_numbers"]
+        params = [
+            sorted(vars(laparams).items()) if laparams is not None else None,
+            sorted(page_numbers) if page_numbers else None,
+        ]
+        params.extend(options[name] for name in CACHE_KEY_OPTIONS)
+        return self.make_key(fname, params, options["use_mmap"])
+
+    def make_key(self, fname: str, params: Any, use_mmap: bool = False) -> str:
+        """Key of fname extracted with params, for callers whose output is
+        not that of extract_text_to_fp, params has to have a stable repr."""
+        params = [pdfminer.__version__, self.file_hash(fname, use_mmap), params]
+        return hashlib.sha256(repr(params).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as fp:
+                output = fp.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return output
+
+    def put(self, key: str, output: bytes) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as fp:
+            fp.write(output)
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self.entries())
+        try:
+            self._total_bytes -= os.stat(path).st_size
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        self._total_bytes += len(output)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) of every entry. Files ending in .tmp are
+        entries another process is still writing and are left alone."""
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * self.EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total
+
+    def report(self) -> None:
+        print(
+            "cache: {} hits, {} misses".format(self.hits, self.misses),
+            file=sys.stderr,
+        )
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "pdf2txt")
+
+
+def binary_outfp(outfp: AnyIO) -> AnyIO:
+    if outfp is sys.stdout:
+        sys.stdout.flush()
+        return sys.stdout.buffer
+    return outfp
+
+
+def extract_files_cached(
+    files: List[str], outfp: AnyIO, options: Dict[str, Any], cache: ExtractionCache
+) -> None:
+    outfp = binary_outfp(outfp)
+    for fname in files:
+        key = cache.key(fname, options)
+        output = cache.get(key)
+        if output is None:
+            _, output, _ = extract_file(fname, options)
+            cache.put(key, output)
+        outfp.write(output)
+
+
+def extract_files_parallel(
+    files: List[str],
+    outfp: AnyIO,
+    jobs: int,
+    options: Dict[str, Any],
+    split_pages: bool = False,
+    cache: Optional[ExtractionCache] = None,
+) -> None:
+    """Fan files, or page chunks of each file with split_pages, out to a pool
+    of `jobs` processes and write the results to outfp in input order,
+    reporting per-task timing on stderr. Tasks found in the cache are not
+    submitted."""
+    tasks = []
+    for fname in files:
+        if split_pages:
+            tasks.extend((fname, chunk) for chunk in split_page_range(fname, jobs, options))
+        else:
+            tasks.append((fname, options))
+
+    outfp = binary_outfp(outfp)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = []
+        for fname, task_options in tasks:
+            key = cache.key(fname, task_options) if cache is not None else None
+            output = cache.get(key) if cache is not None else None
+            if output is None:
+                result = executor.submit(extract_file, fname, task_options)
+            else:
+                result = output
+            pending.append((fname, task_options, key, result))
+        for fname, task_options, key, result in pending:
+            if isinstance(result, bytes):
+                output, timing = result, "cached"
+            else:
+                _, output, elapsed = result.result()
+                timing = "{:.2f}s".format(elapsed)
+                if cache is not None:
+                    cache.put(key, output)
+            outfp.write(output)
+            print(
+                "{}{}: {}".format(fname, describe_pages(task_options), timing),
+                file=sys.stderr,
+            )
+    print(
+        "{} files in {:.2f}s with {} jobs".format(
+            len(files), time.perf_counter() - start, jobs
+        ),
+        file=sys.stderr,
+    )
+
+
 def extract_text(
     files: Iterable[str] = [],
     outfile: str = "-",
@@ -40,6 +472,12 @@ def extract_text(
     output_dir: Optional[str] = None,
     debug: bool = False,
     disable_caching: bool = False,
+    jobs: int = 1,
+    split_pages: bool = False,
+    cache_dir: Optional[str] = None,
+    cache_size: int = 512,
+    use_mmap: bool = False,
+    fast: bool = False,
     **kwargs: Any
 ) -> AnyIO:
     if not files:
@@ -57,9 +495,43 @@ def extract_text(
     else:
         outfp = open(outfile, "wb")
 
-    for fname in files:
-        with open(fname, "rb") as fp:
-            pdfminer.high_level.extract_text_to_fp(fp, **locals())
+    if split_pages and output_type != "text":
+        logging.warning("--split-pages only applies to text output, ignoring it")
+        split_pages = False
+
+    # extracted images are a side effect the cache can not replay
+    cache = None
+    if cache_dir and not output_dir:
+        cache = ExtractionCache(cache_dir, cache_size * 1024 * 1024)
+
+    files = list(files)
+    options = dict(
+        output_type=output_type,
+        codec=codec,
+        laparams=laparams,
+        maxpages=maxpages,
+        page_numbers=page_numbers,
+        password=password,
+        scale=scale,
+        rotation=rotation,
+        layoutmode=layoutmode,
+        output_dir=output_dir,
+        strip_control=strip_control,
+        debug=debug,
+        disable_caching=disable_caching,
+        use_mmap=use_mmap,
+        fast=fast,
+    )
+    if jobs > 1 and (len(files) > 1 or split_pages):
+        extract_files_parallel(files, outfp, jobs, options, split_pages, cache)
+    elif cache is not None:
+        extract_files_cached(files, outfp, options, cache)
+    else:
+        for fname in files:
+            extract_to_fp(fname, outfp, options)
+
+    if cache is not None:
+        cache.report()
     return outfp
 
 
@@ -93,6 +565,49 @@ def parse_args(args: Optional[List[str]]) -> argparse.Namespace:
         action="store_true",
         help="If caching or resources, such as fonts, should be disabled.",
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="The number of worker processes used to extract several files "
+        "at once. Output is still written in input order.",
+    )
+    parser.add_argument(
+        "--split-pages",
+        default=False,
+        action="store_true",
+        help="With --jobs, also split the pages of each file into chunks "
+        "extracted by separate workers. Only used when output_type is text.",
+    )
+    parser.add_argument(
+        "--mmap",
+        dest="use_mmap",
+        default=False,
+        action="store_true",
+        help="Memory-map the input files instead of reading them through "
+        "buffered file objects.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=default_cache_dir(),
+        help="The directory where extracted output is cached, keyed by file "
+        "content and options.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=512,
+        help="The maximum size of the cache in megabytes. Least recently "
+        "used entries are evicted first.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        default=False,
+        action="store_true",
+        help="Do not read or write the extraction cache.",
+    )
 
     parse_params = parser.add_argument_group(
         "Parser", description="Used during PDF parsing"
@@ -146,6 +661,14 @@ def parse_args(args: Optional[List[str]]) -> argparse.Namespace:
         action="store_true",
         help="If layout analysis parameters should be ignored.",
     )
+    la_param_group.add_argument(
+        "--fast",
+        default=False,
+        action="store_true",
+        help="Lay pages out without advanced layout analysis (as with "
+        "--boxes-flow disabled) and redo only the pages whose text looks "
+        "garbled with the full analysis. Only used when output_type is text.",
+    )
     la_param_group.add_argument(
         "--detect-vertical",
         "-V",
@@ -288,6 +811,9 @@ def parse_args(args: Optional[List[str]]) -> argparse.Namespace:
             all_texts=parsed_args.all_texts,
         )
 
+    if parsed_args.no_cache:
+        parsed_args.cache_dir = None
+
     if parsed_args.page_numbers:
         parsed_args.page_numbers = {x - 1 for x in parsed_args.page_numbers}
 
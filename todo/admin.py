@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Todo
+from .models import ExtractedDocument, Todo
 
 # Register your models here.
-admin.site.register(Todo)
\ No newline at end of file
+admin.site.register(Todo)
+admin.site.register(ExtractedDocument)
\ No newline at end of file
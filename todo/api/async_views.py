@@ -0,0 +1,108 @@
+"""
+async todo endpoints for the ASGI entry point (demo.asgi)
+
+the async queryset api (aget/acreate/aiterator) arrives in Django 4.1, on 4.0 the
+orm calls go through sync_to_async, which is also what those methods do internally
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework import status
+from rest_framework.authentication import CSRFCheck
+from rest_framework.exceptions import ValidationError
+from todo.api.renderers import FastJSONRenderer
+from todo.api.serializers import TodoReadSerializer, TodoSerializer
+from todo.models import Todo
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status_code, content_type="application/json"
+    )
+
+
+def get_int_param(request, param, default, min_value=0):
+    value = request.GET.get(param, "")
+    if not value:
+        return default
+    if not value.isdigit():
+        raise ValidationError({param: "A valid integer is required."})
+    if int(value) < min_value:
+        raise ValidationError({param: f"Ensure this value is greater than or equal to {min_value}."})
+    return int(value)
+
+
+def enforce_csrf(request):
+    """
+    the check DRF's SessionAuthentication runs for the sync endpoints, only
+    requests authenticated by the session cookie need a CSRF token
+    :param request:
+    :return: error response or None
+    """
+    user = request.user
+    if not user or not user.is_active:
+        return None
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    reason = check.process_view(request, None, (), {})
+    if reason:
+        return json_response({"detail": f"CSRF Failed: {reason}"}, status.HTTP_403_FORBIDDEN)
+    return None
+
+
+async def todo_list(request):
+    """
+    GET  keyset page ordered by id, ?after=<last id>&page_size=<n>
+    POST create one todo
+    """
+    if request.method == "GET":
+        try:
+            after = get_int_param(request, "after", 0)
+            page_size = min(get_int_param(request, "page_size", PAGE_SIZE, min_value=1), MAX_PAGE_SIZE)
+        except ValidationError as e:
+            return json_response(e.detail, status.HTTP_400_BAD_REQUEST)
+        queryset = (
+            Todo.objects.filter(id__gt=after)
+            .order_by("id")
+            .values_list(*TodoReadSerializer.fields)[:page_size]
+        )
+        rows = await sync_to_async(list)(queryset)
+        results = TodoReadSerializer(rows).data
+        return json_response(
+            {"next_after": results[-1]["id"] if len(results) == page_size else None, "results": results}
+        )
+
+    if request.method == "POST":
+        csrf_error = await sync_to_async(enforce_csrf)(request)
+        if csrf_error:
+            return csrf_error
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return json_response({"detail": "JSON parse error."}, status.HTTP_400_BAD_REQUEST)
+        serializer = TodoSerializer(data=data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        await sync_to_async(serializer.save)()
+        return json_response(serializer.data, status.HTTP_201_CREATED)
+
+    return HttpResponseNotAllowed(["GET", "POST"])
+
+
+async def todo_detail(request, pk):
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    try:
+        todo = await sync_to_async(Todo.objects.get)(pk=pk)
+    except Todo.DoesNotExist:
+        return json_response({"detail": "Not found."}, status.HTTP_404_NOT_FOUND)
+    return json_response(TodoSerializer(todo).data)
+
+
+# csrf_exempt is not async aware before Django 5.0, the middleware only reads this flag;
+# like the sync endpoints the view checks CSRF itself for session authenticated requests
+todo_list.csrf_exempt = True
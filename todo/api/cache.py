@@ -0,0 +1,80 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+LIST_VERSION_KEY = "todo:list:version"
+DETAIL_VERSION_KEY = "todo:detail:version:{pk}"
+
+
+def get_version(version_key):
+    """
+    version counters start from the clock, so a counter evicted by the LRU restarts
+    above every value it had before and old entries can not come back
+    """
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, int(time.time() * 1000), None)
+        version = cache.get(version_key, 0)
+    return version
+
+
+def bump_version(version_key):
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.add(version_key, int(time.time() * 1000), None)
+
+
+def list_cache_key(request):
+    # the cursor links of a page are absolute, built from the scheme and Host of the request
+    uri_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"todo:list:{get_version(LIST_VERSION_KEY)}:{uri_hash}"
+
+
+def detail_cache_key(pk):
+    return f"todo:detail:{pk}:{get_version(DETAIL_VERSION_KEY.format(pk=pk))}"
+
+
+def invalidate_todos(pks):
+    """
+    drop every cached list page and the detail entries of the given todo ids
+    :param pks:
+    :return:
+    """
+    bump_version(LIST_VERSION_KEY)
+    for pk in pks:
+        bump_version(DETAIL_VERSION_KEY.format(pk=pk))
+
+
+def make_etag(data):
+    return quote_etag(hashlib.md5(JSONRenderer().render(data)).hexdigest())
+
+
+def cached_response(request, cache_key, build_response):
+    """
+    serve a GET from the cache, building and storing it on a miss
+    a matching If-None-Match returns 304 straight from the cached etag
+    :param request:
+    :param cache_key:
+    :param build_response:
+    :return:
+    """
+    entry = cache.get(cache_key)
+    if entry is None:
+        response = build_response()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        entry = {"data": response.data, "etag": make_etag(response.data)}
+        cache.set(cache_key, entry)
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if "*" in etags or entry["etag"] in etags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": entry["etag"]})
+    return Response(entry["data"], headers={"ETag": entry["etag"]})
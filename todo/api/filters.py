@@ -0,0 +1,52 @@
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+def get_prefix_upper_bound(prefix):
+    """
+    smallest string greater than every string starting with prefix
+    e.g. "abc" -> "abd"
+    :param prefix:
+    :return:
+    """
+    last_char = ord(prefix[-1])
+    if last_char == 0x10FFFF:
+        return None
+    return prefix[:-1] + chr(last_char + 1)
+
+
+class TodoFilterBackend(BaseFilterBackend):
+    """
+    ?created_after=<iso datetime>&created_before=<iso datetime> todo_creation range
+    ?title_prefix=<text> case sensitive todo_tile prefix
+
+    the prefix is sent as a todo_tile range instead of startswith, sqlite runs LIKE
+    without an index, a range is an index range scan on todo_tile_id_idx
+    """
+
+    def get_datetime_param(self, request, param):
+        value = request.query_params.get(param)
+        if not value:
+            return None
+        date = parse_datetime(value)
+        if date is None:
+            raise ValidationError({param: "Enter a valid ISO 8601 datetime."})
+        return date
+
+    def filter_queryset(self, request, queryset, view):
+        created_after = self.get_datetime_param(request, "created_after")
+        if created_after:
+            queryset = queryset.filter(todo_creation__gte=created_after)
+
+        created_before = self.get_datetime_param(request, "created_before")
+        if created_before:
+            queryset = queryset.filter(todo_creation__lt=created_before)
+
+        title_prefix = request.query_params.get("title_prefix")
+        if title_prefix:
+            queryset = queryset.filter(todo_tile__gte=title_prefix)
+            upper_bound = get_prefix_upper_bound(title_prefix)
+            if upper_bound:
+                queryset = queryset.filter(todo_tile__lt=upper_bound)
+        return queryset
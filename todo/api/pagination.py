@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TodoCursorPagination(CursorPagination):
+    """
+    keyset pagination on (todo_creation, id), served by the todo_creation_id_idx index
+    every page is an index range scan from the cursor position, so fetching page N
+    costs the same as fetching page 1
+    """
+    ordering = ("todo_creation", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
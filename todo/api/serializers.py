@@ -1,8 +1,89 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
-from todo.models import Todo
+from todo.api.cache import invalidate_todos
+from todo.models import Todo, TodoSyncCounter
+
+DEFAULT_BULK_BATCH_SIZE = 500
+
+
+def get_bulk_batch_size(context):
+    return context.get("batch_size") or getattr(
+        settings, "TODO_BULK_BATCH_SIZE", DEFAULT_BULK_BATCH_SIZE
+    )
+
+
+class TodoListSerializer(serializers.ListSerializer):
+    """
+    many=True path for TodoSerializer
+    rows are validated in memory and written with bulk_create/bulk_update in batches
+    bulk writes send no model signals and skip Todo.save and auto_now,
+    so updated_at, sync_version and the api cache are handled here, the cache is
+    invalidated once the transaction commits
+    """
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            sync_version = TodoSyncCounter.next_version()
+            todos = [Todo(sync_version=sync_version, **attrs) for attrs in validated_data]
+            todos = Todo.objects.bulk_create(todos, batch_size=get_bulk_batch_size(self.context))
+        transaction.on_commit(partial(invalidate_todos, [todo.pk for todo in todos if todo.pk is not None]))
+        return todos
+
+    def update(self, instance, validated_data):
+        """
+        instance is the list of todos in the same order as validated_data
+        """
+        updated_at = timezone.now()
+        update_fields = set()
+        for todo, attrs in zip(instance, validated_data):
+            for attr, value in attrs.items():
+                setattr(todo, attr, value)
+            todo.updated_at = updated_at
+            update_fields.update(attrs)
+        if update_fields:
+            update_fields.update(["updated_at", "sync_version"])
+            with transaction.atomic():
+                sync_version = TodoSyncCounter.next_version()
+                for todo in instance:
+                    todo.sync_version = sync_version
+                Todo.objects.bulk_update(
+                    instance, sorted(update_fields), batch_size=get_bulk_batch_size(self.context)
+                )
+            transaction.on_commit(partial(invalidate_todos, [todo.pk for todo in instance]))
+        return instance
 
 
 class TodoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Todo
         fields = ["id","todo_tile","todo_description","todo_creation"]
+        list_serializer_class = TodoListSerializer
+
+
+class TodoReadSerializer:
+    """
+    read-only fast path producing the same output as TodoSerializer
+    works on values_list() rows, so there is no per-row field introspection
+    """
+    fields = TodoSerializer.Meta.fields
+    datetime_field = serializers.DateTimeField()
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @property
+    def data(self):
+        format_datetime = self.datetime_field.to_representation
+        return [
+            {
+                "id": todo_id,
+                "todo_tile": todo_tile,
+                "todo_description": todo_description,
+                "todo_creation": format_datetime(todo_creation),
+            }
+            for todo_id, todo_tile, todo_description, todo_creation in self.rows
+        ]
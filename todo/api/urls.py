@@ -1,10 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
+from .async_views import todo_detail, todo_list
 from .views import *
 app_name = "todo"
 router = SimpleRouter()
 router.register("todo", TodoViewSet, basename="todo")
 
 urlpatterns = [
-    path("", include(router.urls))
+    path("", include(router.urls)),
+    path("async/todo/", todo_list, name="async-todo-list"),
+    path("async/todo/<int:pk>/", todo_detail, name="async-todo-detail"),
 ]
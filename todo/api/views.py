@@ -1,9 +1,267 @@
+from functools import partial
+
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.viewsets import ModelViewSet
-from todo.api.serializers import TodoSerializer
-from todo.models import Todo
+from todo.api.cache import cached_response, detail_cache_key, invalidate_todos, list_cache_key
+from todo.api.filters import TodoFilterBackend
+from todo.api.pagination import TodoCursorPagination
+from todo.api.parsers import NDJSONParser
+from todo.api.renderers import FastJSONRenderer, NDJSONRenderer
+from todo.api.serializers import TodoReadSerializer, TodoSerializer, get_bulk_batch_size
+from todo.models import Todo, TodoSyncCounter, TodoTombstone
+from todo.search import search_todos
+
+EXPORT_CHUNK_SIZE = 2000
+SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+
+
+def decode_sync_token(token, current_version):
+    """
+    a token is the sync version a client has seen, a token ahead of the current
+    version (e.g. one from before the counter existed) is rejected so the client
+    starts over
+    """
+    if not token.isdigit() or int(token) > current_version:
+        raise ValidationError({"since": "Invalid sync token."})
+    return int(token)
 
 
 class TodoViewSet(ModelViewSet):
     serializer_class = TodoSerializer
     queryset = Todo.objects.all()
-    pass
\ No newline at end of file
+    pagination_class = TodoCursorPagination
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [NDJSONParser]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    filter_backends = [TodoFilterBackend, OrderingFilter]
+    # every ordering field is the leading column of an index and one of the
+    # TodoReadSerializer fields, the cursor of the fast path is read from those
+    # updated_at changes on every write, a cursor on it would skip or repeat rows
+    ordering_fields = ["todo_creation", "todo_tile", "id"]
+    ordering = ("todo_creation", "id")
+
+    def list(self, request, *args, **kwargs):
+        """
+        ?serializer=fast switches to the values_list() read path
+        """
+        if request.query_params.get("serializer") == "fast":
+            build_response = partial(self.fast_list, request)
+        else:
+            build_response = partial(super().list, request, *args, **kwargs)
+        return cached_response(request, list_cache_key(request), build_response)
+
+    def retrieve(self, request, *args, **kwargs):
+        build_response = partial(super().retrieve, request, *args, **kwargs)
+        lookup_value = kwargs[self.lookup_field]
+        if not lookup_value.isdigit():
+            return build_response()
+        # /todo/01/ and /todo/1/ share the entry invalidated by pk
+        return cached_response(request, detail_cache_key(int(lookup_value)), build_response)
+
+    def fast_list(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).values_list(
+            *TodoReadSerializer.fields, named=True
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(TodoReadSerializer(page).data)
+        return Response(TodoReadSerializer(queryset).data)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        batch_size = self.request.query_params.get("batch_size")
+        if batch_size:
+            if not batch_size.isdigit() or int(batch_size) < 1:
+                raise ValidationError({"batch_size": "A positive integer is required."})
+            context["batch_size"] = int(batch_size)
+        return context
+
+    def get_bulk_ids(self, data):
+        """
+        ids of a bulk request body, either a list of ids or a list of objects with an id
+        :param data:
+        :return:
+        """
+        if not isinstance(data, list):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ["Expected a list of items."]})
+        ids = []
+        seen_ids = set()
+        errors = []
+        for item in data:
+            todo_id = item.get("id") if isinstance(item, dict) else item
+            if not isinstance(todo_id, int) or isinstance(todo_id, bool):
+                errors.append({"id": ["A valid integer is required."]})
+            elif todo_id in seen_ids:
+                # the later item would silently win over the earlier one
+                errors.append({"id": ["Duplicate id."]})
+            else:
+                errors.append({})
+                seen_ids.add(todo_id)
+            ids.append(todo_id)
+        if any(errors):
+            raise ValidationError(errors)
+        return ids
+
+    def get_export_queryset(self):
+        """
+        export queryset with the list filters and the incremental filters applied
+        ?created_since=<iso datetime>&min_id=<id>&max_id=<id>
+        :return:
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by("id")
+        params = self.request.query_params
+
+        created_since = params.get("created_since")
+        if created_since:
+            created_since_date = parse_datetime(created_since)
+            if created_since_date is None:
+                raise ValidationError({"created_since": "Enter a valid ISO 8601 datetime."})
+            queryset = queryset.filter(todo_creation__gte=created_since_date)
+
+        for param, lookup in (("min_id", "id__gte"), ("max_id", "id__lte")):
+            value = params.get(param)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({param: "A valid integer is required."})
+                queryset = queryset.filter(**{lookup: int(value)})
+        return queryset
+
+    def export_lines(self, queryset):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+        for todo in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            line = encoder.encode(self.get_serializer(todo).data)
+            # escaped like JSONRenderer does, readers splitting on unicode line breaks see one line per todo
+            yield line.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029") + "\n"
+
+    @action(detail=False, methods=["get"], renderer_classes=[NDJSONRenderer, FastJSONRenderer])
+    def export(self, request):
+        """
+        stream every todo as newline-delimited JSON, one row at a time
+        """
+        queryset = self.get_export_queryset()
+        response = StreamingHttpResponse(
+            self.export_lines(queryset), content_type="application/x-ndjson"
+        )
+        response["Content-Disposition"] = 'attachment; filename="todos.ndjson"'
+        return response
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request):
+        """
+        create a list (or NDJSON body) of todos in one transaction
+        """
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.put
+    def bulk_update(self, request, partial=False):
+        """
+        update a list of todos, every item carries its id, in one transaction
+        """
+        ids = self.get_bulk_ids(request.data)
+        # the rows are read inside the transaction writing them, locked where the
+        # database supports it (the concurrent sqlite profile begins immediate),
+        # so a write of another request in between is not overwritten
+        with transaction.atomic():
+            todos = self.get_queryset().select_for_update().in_bulk(ids)
+            missing = [{} if todo_id in todos else {"id": ["Not found."]} for todo_id in ids]
+            if any(missing):
+                raise ValidationError(missing)
+            serializer = self.get_serializer(
+                [todos[todo_id] for todo_id in ids], data=request.data, many=True, partial=partial
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return Response(serializer.data)
+
+    @bulk_create.mapping.patch
+    def bulk_partial_update(self, request):
+        return self.bulk_update(request, partial=True)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        """
+        delete a list of todo ids in batches inside one transaction
+        the rows are deleted without the per row post_delete signal, the tombstones
+        of a request share one sync version and the cache is invalidated once
+        """
+        ids = self.get_bulk_ids(request.data)
+        batch_size = get_bulk_batch_size(self.get_serializer_context())
+        deleted_ids = set()
+        with transaction.atomic():
+            sync_version = None
+            for start in range(0, len(ids), batch_size):
+                batch_ids = list(
+                    self.get_queryset().filter(id__in=ids[start:start + batch_size]).values_list("id", flat=True)
+                )
+                if not batch_ids:
+                    continue
+                if sync_version is None:
+                    sync_version = TodoSyncCounter.next_version()
+                # the delete of QuerySet.delete() when nothing listens to the signals,
+                # a Django internal, nothing references Todo so there is nothing to cascade
+                batch = Todo.objects.filter(id__in=batch_ids)
+                batch._raw_delete(batch.db)
+                TodoTombstone.objects.bulk_create(
+                    [TodoTombstone(todo_id=todo_id, sync_version=sync_version) for todo_id in batch_ids]
+                )
+                deleted_ids.update(batch_ids)
+        if deleted_ids:
+            transaction.on_commit(partial(invalidate_todos, sorted(deleted_ids)))
+        return Response([{"id": todo_id, "deleted": todo_id in deleted_ids} for todo_id in ids])
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        todos created/updated and ids deleted after ?since=<token>
+        without a token every todo is returned; poll again with the returned token
+        """
+        # read before the rows: every version up to it is committed, rows written
+        # meanwhile may come twice but none is missed
+        current_version = TodoSyncCounter.current_version()
+        updated = self.get_queryset().order_by("sync_version", "id")
+        deleted = []
+        since = request.query_params.get("since")
+        if since:
+            since_version = decode_sync_token(since, current_version)
+            updated = updated.filter(sync_version__gt=since_version)
+            deleted = (
+                TodoTombstone.objects.filter(sync_version__gt=since_version)
+                .order_by("sync_version")
+                .values_list("todo_id", flat=True)
+            )
+        updated = updated.values_list(*TodoReadSerializer.fields)
+        return Response(
+            {
+                "token": str(current_version),
+                "updated": TodoReadSerializer(updated).data,
+                "deleted": list(deleted),
+            }
+        )
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        full text search on title and description, ?q=<words>&limit=<n>
+        every word also matches as a prefix, results are ranked best first
+        """
+        query = request.query_params.get("q", "")
+        limit = request.query_params.get("limit", "")
+        if limit and not limit.isdigit():
+            raise ValidationError({"limit": "A valid integer is required."})
+        limit = min(int(limit or SEARCH_LIMIT), MAX_SEARCH_LIMIT)
+        serializer = self.get_serializer(search_todos(query, limit), many=True)
+        return Response(serializer.data)
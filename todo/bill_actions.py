@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from django.db import transaction
+
+BILL_ACTION_BATCH_SIZE = 500
+
+
+def get_date_from_datetime(date_string):
+    if "T" in date_string:
+        date = datetime.strptime(
+            date_string.replace("+00:00", ""), "%Y-%m-%dT%H:%M:%S"
+        ).date()
+    else:
+        date = date_string
+    return date
+
+
+def bill_actions_data(bill_data, state_legislator_bill_obj):
+    """
+    bill actions data by order, a later action with the same order wins
+    :param bill_data:
+    :param state_legislator_bill_obj:
+    :return:
+    """
+    bill_actions_by_order = {}
+    all_bill_actions = bill_data.get("actions", [])
+    for bill_actions in all_bill_actions:
+        bill_action_data = {}
+        bill_action_description = bill_actions.get("description", "")
+        bill_action_date = bill_actions.get("date", "")
+        bill_action_order = bill_actions.get("order", "")
+        bill_org_name = (
+            bill_actions["organization"].get("name", "")
+            if bill_actions.get("organization")
+            else ""
+        )
+        bill_org_classification = (
+            bill_actions["organization"].get("classification", "")
+            if bill_actions.get("organization")
+            else ""
+        )
+        bill_action_data.update(
+            {
+                "state_legislator_bill": state_legislator_bill_obj,
+                "org_classification": bill_org_classification,
+                "org_name": bill_org_name,
+                "description": bill_action_description,
+                "order": bill_action_order,
+            }
+        )
+        if bill_action_date:
+            bill_action_date = get_date_from_datetime(bill_action_date)
+            bill_action_data.update({"date": bill_action_date})
+        bill_actions_by_order[bill_action_order] = bill_action_data
+    return bill_actions_by_order
+
+
+def store_bill_actions(bills, action_model, batch_size=BILL_ACTION_BATCH_SIZE):
+    """
+    bill actions of a page of bills store, the existing actions are loaded in
+    one query and the rest is inserted and updated in batches
+    :param bills: (state legislator bill obj, bill data)
+    :param action_model: StateLegislatorBillAction
+    :param batch_size:
+    :return: (actions added, actions updated)
+    """
+    existing_actions = {}
+    for bill_action in action_model.objects.filter(
+        state_legislator_bill__in=[state_legislator_bill_obj for state_legislator_bill_obj, _ in bills]
+    ):
+        existing_actions.setdefault((bill_action.state_legislator_bill_id, str(bill_action.order)), bill_action)
+
+    new_actions = []
+    updated_actions = []
+    for state_legislator_bill_obj, bill_data in bills:
+        for order, bill_action_data in bill_actions_data(bill_data, state_legislator_bill_obj).items():
+            bill_action = existing_actions.get((state_legislator_bill_obj.id, str(order)))
+            if bill_action is None:
+                new_actions.append(action_model(**bill_action_data))
+            else:
+                for field, value in bill_action_data.items():
+                    setattr(bill_action, field, value)
+                updated_actions.append(bill_action)
+
+    with transaction.atomic():
+        action_model.objects.bulk_create(new_actions, batch_size=batch_size)
+        action_model.objects.bulk_update(
+            updated_actions,
+            ["org_classification", "org_name", "description", "date"],
+            batch_size=batch_size,
+        )
+    return len(new_actions), len(updated_actions)
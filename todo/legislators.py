@@ -0,0 +1,73 @@
+import difflib
+import unicodedata
+
+
+def normalize_name(name):
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+class LegislatorNameIndex:
+    """
+    sponsor names of a state resolved in memory, a name is looked up as the
+    full name of a legislator, then as a name in its openstates full_response,
+    then as part of a full name (like the icontains query it replaces) and at
+    last, with fuzzy_cutoff, as the closest full name or alias
+    """
+
+    def __init__(self, legislators, fuzzy_cutoff=None):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.full_names = {}
+        self.aliases = {}
+        self.matches = {}
+        # lowest pk first, like .first() of the queries
+        self.legislators = []
+        for legislator in sorted(legislators, key=lambda legislator: legislator.pk):
+            full_name = normalize_name(f"{legislator.first_name} {legislator.last_name}")
+            self.legislators.append((full_name, legislator))
+            self.full_names.setdefault(full_name, legislator)
+            for alias in self.get_aliases(legislator.full_response):
+                self.aliases.setdefault(alias, legislator)
+
+    def get_aliases(self, full_response):
+        """
+        names of a legislator in its openstates full_response, entries of another
+        shape than the api documents are ignored
+        :param full_response:
+        :return:
+        """
+        if not isinstance(full_response, dict):
+            return []
+        names = [full_response.get("name")]
+        other_names = full_response.get("other_names")
+        if isinstance(other_names, list):
+            names.extend(other_name.get("name") for other_name in other_names if isinstance(other_name, dict))
+        given_name, family_name = full_response.get("given_name"), full_response.get("family_name")
+        if given_name and family_name and isinstance(given_name, str) and isinstance(family_name, str):
+            names.append(f"{given_name} {family_name}")
+        return [normalize_name(name) for name in names if name and isinstance(name, str)]
+
+    def lookup(self, name):
+        """
+        legislator with the name or None
+        :param name:
+        :return:
+        """
+        name = normalize_name(name)
+        if name not in self.matches:
+            self.matches[name] = self.find(name)
+        return self.matches[name]
+
+    def find(self, name):
+        legislator = self.full_names.get(name) or self.aliases.get(name)
+        if legislator:
+            return legislator
+        for full_name, legislator in self.legislators:
+            if name in full_name:
+                return legislator
+        if self.fuzzy_cutoff:
+            close_names = difflib.get_close_matches(
+                name, list(self.full_names) + list(self.aliases), n=1, cutoff=self.fuzzy_cutoff
+            )
+            if close_names:
+                return self.full_names.get(close_names[0]) or self.aliases[close_names[0]]
+        return None
@@ -1,17 +1,33 @@
-import time
+import copy
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import requests
 from django.core.management import BaseCommand, call_command
+from django.db import connections
 from common.models import State
 from directories.congress.models import (
     StateLegislatorBill,
     StateLegislatorBillAction,
     StateLegislator,
 )
-from django.db.models import Value as V
-from django.db.models.functions import Concat
 from directories.states.models import StateBillAPIKeyTracker, StateBillTracker, StateLegislativeSession
 from utils.state_bill_text_mapper import state_bill_text_command_mapper
+from todo.bill_actions import get_date_from_datetime, store_bill_actions
+from todo.legislators import LegislatorNameIndex
+from todo.openstates import (
+    REQUESTS_PER_MINUTE,
+    APIKeySpent,
+    TokenBucket,
+    is_quota_spent,
+    metrics,
+    openstates_get,
+)
+
+# a bill page failing with anything but a spent api key is requested this many times
+MAX_PAGE_ATTEMPTS = 3
 
 
 class Command(BaseCommand):
@@ -30,6 +46,12 @@ class Command(BaseCommand):
     python manage.py add_legislator_bill --jurisdiction_id=ocd-jurisdiction/country:us/state:al/government
     juridiction_id pass
 
+    bill pages are fetched by --workers threads, the requests of an api key are
+    limited to --requests_per_minute and a Retry-After of the api is honoured
+
+    without --jurisdiction_id all available api keys are leased at once, every key
+    crawls the states left in a shared queue with its own rate budget
+
     """
 
     def add_arguments(self, parser):
@@ -37,6 +59,12 @@ class Command(BaseCommand):
         parser.add_argument("--jurisdiction_id", type=str)
         parser.add_argument("--bill_page_no", type=int)
         parser.add_argument("--bill_id", type=str)
+        parser.add_argument("--workers", type=int, default=4, help="threads fetching bill pages")
+        parser.add_argument("--requests_per_minute", type=float, default=REQUESTS_PER_MINUTE,
+                            help="request quota of an api key")
+        parser.add_argument("--fuzzy_names", type=float,
+                            help="match sponsors not found by name to the closest legislator name "
+                                 "at least this similar, 0 to 1")
 
         """data will be available today date to that date Date formate: yyyy-mm-dd"""
         parser.add_argument("--created_since", type=str)
@@ -50,13 +78,7 @@ class Command(BaseCommand):
         return state_obj
 
     def get_date_from_datetime(self, date_string):
-        if "T" in date_string:
-            date = datetime.strptime(
-                date_string.replace("+00:00", ""), "%Y-%m-%dT%H:%M:%S"
-            ).date()
-        else:
-            date = date_string
-        return date
+        return get_date_from_datetime(date_string)
 
     def get_chamber(self, bill_content):
         form_organization_data = bill_content.get("from_organization", "")
@@ -69,20 +91,28 @@ class Command(BaseCommand):
                 chamber = StateLegislatorBill.SENATE
         return chamber
 
+    def get_legislator_index(self, state_obj):
+        """
+        name index of the legislators of a state, built once per crawl and
+        shared by the workers
+        :param state_obj:
+        :return:
+        """
+        state_id = state_obj.id if state_obj else None
+        with self.legislator_index_lock:
+            legislator_index = self.legislator_indexes.get(state_id)
+            if legislator_index is None:
+                legislator_index = LegislatorNameIndex(
+                    StateLegislator.objects.filter(legislator_state=state_obj).only(
+                        "id", "first_name", "last_name", "full_response"
+                    ),
+                    self.fuzzy_names,
+                )
+                self.legislator_indexes[state_id] = legislator_index
+        return legislator_index
+
     def state_legislator(self, name, state_obj):
-        state_legislator = (
-            StateLegislator.objects.annotate(
-                family_name=Concat("first_name", V(" "), "last_name")
-            )
-                .filter(family_name__icontains=name, legislator_state=state_obj)
-                .first()
-        )
-        if state_legislator:
-            return state_legislator
-        else:
-            return StateLegislator.objects.filter(
-                full_response__name=name, legislator_state=state_obj
-            ).first()
+        return self.get_legislator_index(state_obj).lookup(name)
 
     def get_bill_sponsorship(self, sponsor, state_obj):
         """
@@ -124,54 +154,33 @@ class Command(BaseCommand):
                     co_sponsor_legislator_list.append(legislator_obj.id)
         return sponsor_legislator_list, co_sponsor_legislator_list
 
-    def bill_actions_data(self, bill_data, state_legislator_bill_obj):
+    def store_bill_actions(self, bills):
+        new_actions, updated_actions = store_bill_actions(bills, StateLegislatorBillAction)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"State legislature bill actions added -- {new_actions} updated -- {updated_actions}"
+            )
+        )
+
+    def store_state_legislature_bills(self, state_legislature_bills):
         """
-        bill actions store
-        :param bill_data:
-        :param state_legislator_bill_obj:
+        bills of a page store, the actions of all bills are stored together before
+        the bill texts
+        :param state_legislature_bills:
         :return:
         """
-        all_bill_actions = bill_data.get("actions", [])
-        for bill_actions in all_bill_actions:
-            bill_action_data = {}
-            bill_action_description = bill_actions.get("description", "")
-            bill_action_date = bill_actions.get("date", "")
-            bill_action_order = bill_actions.get("order", "")
-            bill_org_name = (
-                bill_actions["organization"].get("name", "")
-                if bill_actions.get("organization")
-                else ""
-            )
-            bill_org_classification = (
-                bill_actions["organization"].get("classification", "")
-                if bill_actions.get("organization")
-                else ""
-            )
-            bill_action_data.update(
-                {
-                    "state_legislator_bill": state_legislator_bill_obj,
-                    "org_classification": bill_org_classification,
-                    "org_name": bill_org_name,
-                    "description": bill_action_description,
-                    "order": bill_action_order,
-                }
-            )
-            if bill_action_date:
-                bill_action_date = self.get_date_from_datetime(bill_action_date)
-                bill_action_data.update({"date": bill_action_date})
-
-            bill_action_bill = StateLegislatorBillAction.objects.update_or_create(
-                state_legislator_bill=state_legislator_bill_obj,
-                order=bill_action_order,
-                defaults=bill_action_data,
-            )[0]
-            if bill_action_bill:
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"State legislature bill action add Bill id - {state_legislator_bill_obj.id} action id -- {bill_action_bill.id}"
-                    )
-                )
-        return None
+        bills = []
+        for state_legislature_bill in state_legislature_bills:
+            state_legislator_bill_obj = self.store_state_legislature_bill(state_legislature_bill)
+            if state_legislator_bill_obj:
+                bills.append((state_legislator_bill_obj, state_legislature_bill))
+
+        # bill actions store
+        self.store_bill_actions(bills)
+
+        # bill text store
+        for state_legislator_bill_obj, _ in bills:
+            self.bill_text_data_store(state_legislator_bill_obj)
 
     def bill_text_data_store(self, state_legislator_bill_obj):
         state_bill_text_command_name = state_bill_text_command_mapper.get(state_legislator_bill_obj.state.name)
@@ -192,9 +201,9 @@ class Command(BaseCommand):
 
     def store_state_legislature_bill(self, state_legislature_bill):
         """
-        bill data get update in database
+        bill data get update in database, actions and text are stored by store_state_legislature_bills
         :param state_legislature_bill:
-        :return:
+        :return: state legislator bill obj or None
         """
 
         state_legislator_bill = {}
@@ -275,13 +284,7 @@ class Command(BaseCommand):
                         )
                     )
 
-                # bill actions store
-                self.bill_actions_data(
-                    state_legislature_bill, state_legislator_bill_obj
-                )
-
-                # bill text store
-                self.bill_text_data_store(state_legislator_bill_obj)
+                return state_legislator_bill_obj
             else:
                 self.stdout.write(self.style.ERROR(f"State Bill not add -- {bill_id}"))
         else:
@@ -293,82 +296,196 @@ class Command(BaseCommand):
     def get_api_key(self):
         return StateBillAPIKeyTracker.objects.filter(is_available=True).first()
 
+    def retire_api_key(self, api_key):
+        """
+        mark api_key spent and switch to the next available key, pages still in
+        flight with the spent key only switch to the current one, a leased key
+        is not replaced, the other keys are leased by other workers
+        :param api_key:
+        :return:
+        """
+        if api_key != self.api_key:
+            return
+        self.stdout.write(
+            self.style.ERROR(f"ERROR: API key {self.api_key} expired")
+        )
+        self.api_key_obj.is_available = False
+        self.api_key_obj.retired_time = self.today_date
+        self.api_key_obj.save()
+        if self.leased:
+            raise APIKeySpent(api_key)
+        self.api_key_obj = self.get_api_key()
+        if not self.api_key_obj:
+            raise Exception("No API Key is available")
+        self.api_key = self.api_key_obj.key
+
+    def get_token_bucket(self, api_key):
+        return self.token_buckets.setdefault(api_key, TokenBucket(self.requests_per_minute / 60))
+
     def get_state_bill_status(self, jurisdictions_id):
         return StateBillTracker.objects.filter(
             state_jurisdiction_id=jurisdictions_id
         ).exists()
 
-    def state_legislator_bill(self, jurisdiction_id):
+    def fetch_bill_page(self, jurisdiction_id, page_num, api_key):
         """
-        jurisdiction id, api key, page number add dynamically in url
+        jurisdiction id, api key, page number add dynamically in url, runs in the worker threads
         :param jurisdiction_id:
-        :return:
+        :param page_num:
+        :param api_key:
+        :return: (api key, response or None when the request failed)
         """
-        bill_url = f"https://v3.openstates.org/bills?jurisdiction={jurisdiction_id}&sort=updated_desc&include=sponsorships&include=abstracts&include=other_titles&include=other_identifiers&include=actions&include=sources&include=documents&include=versions&include=votes&page={self.page_num}&per_page=20&apikey={self.api_key}"
-        data = requests.get(bill_url)
-        time.sleep(20)
-        if data.status_code == 200:
-            resp = data.json()
-            data_contents = resp.get("results", [])
-            for data_content in data_contents:
-                self.store_state_legislature_bill(data_content)
-            max_page = int(resp["pagination"]["max_page"])
-            if self.page_num <= max_page:
-                if self.page_num == max_page:
-                    self.stdout.write(
-                        self.style.SUCCESS(f"Last page - {self.page_num}")
-                    )
-                    self.page_num = 1
-                    StateBillTracker.objects.create(
-                        state_jurisdiction_id=jurisdiction_id
+        bill_url = f"https://v3.openstates.org/bills?jurisdiction={jurisdiction_id}&sort=updated_desc&include=sponsorships&include=abstracts&include=other_titles&include=other_identifiers&include=actions&include=sources&include=documents&include=versions&include=votes&page={page_num}&per_page=20&apikey={api_key}"
+        try:
+            return api_key, openstates_get(bill_url, self.get_token_bucket(api_key))
+        except requests.RequestException as e:
+            self.stdout.write(self.style.ERROR(f"bill request error- {e} - page: {page_num}"))
+            return api_key, None
+
+    def get_bill_page(self, jurisdiction_id, page_num, fetched=None):
+        """
+        bill page data, a spent api key is replaced and the page requested again
+        :param jurisdiction_id:
+        :param page_num:
+        :param fetched: (api key, response) of a worker thread
+        :return: page data or None
+        """
+        self.page_num = page_num
+        attempts = 0
+        while attempts < MAX_PAGE_ATTEMPTS:
+            api_key, data = fetched or self.fetch_bill_page(jurisdiction_id, page_num, self.api_key)
+            fetched = None
+            if data is None:
+                attempts += 1
+            elif data.status_code == 200:
+                return data.json()
+            elif is_quota_spent(data):
+                self.retire_api_key(api_key)
+            else:
+                attempts += 1
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"bill data error- data: {data} - page: {page_num} - jurisdiction: {jurisdiction_id}"
                     )
-                    return False
-                else:
-                    self.page_num += 1
-                    return True
-        elif data.status_code == 429:
-            self.stdout.write(
-                self.style.ERROR(f"ERROR: API key {self.api_key} expired")
-            )
-            self.api_key_obj.is_available = False
-            self.api_key_obj.retired_time = self.today_date
-            self.api_key_obj.save()
-            self.api_key_obj = self.get_api_key()
-            if not self.api_key_obj:
-                raise Exception("No API Key is available")
-            self.api_key = self.api_key_obj.key
-            return True
-        else:
-            self.stdout.write(
-                self.style.ERROR(
-                    f"bill data error- data: {data} - BILL_URL: {bill_url}"
                 )
+        return None
+
+    def state_legislator_bill(self, resp, page_num):
+        """
+        store all bills of a page
+        :param resp:
+        :param page_num:
+        :return:
+        """
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n\n****** Date: {self.today_date} ****** page number: {page_num} ****** state name: {self.state_name}"
             )
-            return True
+        )
+        data_contents = resp.get("results", [])
+        self.store_state_legislature_bills(data_contents)
 
     def state_bill_update(self, jurisdiction_id, state_name, bill_page_no):
         """
-        while loop in all jurisdictions state execute
+        all bill pages of a jurisdiction, the first page gives the page count and
+        the rest is fetched concurrently, pages are stored in order, when a leased
+        key is spent self.page_num is the page to resume from
         :param jurisdiction_id:
         :param state_name:
         :return:
         """
-        if bill_page_no:
-            self.page_num = bill_page_no
-        else:
-            self.page_num = 1
+        self.state_name = state_name if state_name else jurisdiction_id
+        page_num = bill_page_no if bill_page_no else 1
+        resp = self.get_bill_page(jurisdiction_id, page_num)
+        if resp is None:
+            return
+        self.state_legislator_bill(resp, page_num)
+        max_page = int(resp["pagination"]["max_page"])
+
+        failed_pages = []
+        pending = deque()
+
+        def store_page():
+            pending_page_num, future = pending.popleft()
+            page_resp = self.get_bill_page(jurisdiction_id, pending_page_num, future.result())
+            if page_resp is None:
+                failed_pages.append(pending_page_num)
+            else:
+                self.state_legislator_bill(page_resp, pending_page_num)
 
-        while True:
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for next_page_num in range(page_num + 1, max_page + 1):
+                    pending.append(
+                        (next_page_num, executor.submit(self.fetch_bill_page, jurisdiction_id, next_page_num, self.api_key))
+                    )
+                    # at most 2 * workers fetched pages wait to be stored
+                    while pending and (pending[0][1].done() or len(pending) > self.workers * 2):
+                        store_page()
+                while pending:
+                    store_page()
+            except APIKeySpent:
+                executor.shutdown(cancel_futures=True)
+                self.page_num = min(failed_pages + [self.page_num])
+                raise
+
+        if failed_pages:
             self.stdout.write(
-                self.style.SUCCESS(
-                    f"\n\n****** Date: {self.today_date} ****** page number: {self.page_num} ****** state name: {state_name if state_name else jurisdiction_id}"
-                )
+                self.style.ERROR(f"Pages not stored - {failed_pages} state name: {self.state_name}")
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"Last page - {max_page}")
+            )
+            StateBillTracker.objects.create(
+                state_jurisdiction_id=jurisdiction_id
             )
-            status = self.state_legislator_bill(jurisdiction_id)
-            if not status:
-                break
-
 
+    def crawl_with_key(self, api_key_obj, jurisdictions):
+        """
+        crawl states from the queue with one leased api key until the queue is
+        empty or the key is spent, runs in a thread per key
+        :param api_key_obj:
+        :param jurisdictions: queue of (jurisdiction id, state name, page number)
+        :return:
+        """
+        crawler = copy.copy(self)
+        crawler.leased = True
+        crawler.api_key_obj = api_key_obj
+        crawler.api_key = api_key_obj.key
+        try:
+            while True:
+                try:
+                    jurisdiction_id, state_name, page_num = jurisdictions.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    crawler.state_bill_update(jurisdiction_id, state_name, page_num)
+                except APIKeySpent:
+                    # another key goes on from the first page not stored
+                    jurisdictions.put((jurisdiction_id, state_name, crawler.page_num))
+                    return
+        finally:
+            # database connections are per thread
+            connections.close_all()
+
+    def crawl_jurisdictions(self, jurisdictions):
+        """
+        lease all available api keys and crawl the queued states with a worker per key
+        :param jurisdictions:
+        :return:
+        """
+        while not jurisdictions.empty():
+            api_key_objs = list(StateBillAPIKeyTracker.objects.filter(is_available=True))
+            if not api_key_objs:
+                raise Exception("No API Key is available")
+            self.stdout.write(self.style.SUCCESS(f"API keys leased - {len(api_key_objs)}"))
+            with ThreadPoolExecutor(max_workers=len(api_key_objs)) as executor:
+                futures = [
+                    executor.submit(self.crawl_with_key, api_key_obj, jurisdictions) for api_key_obj in api_key_objs
+                ]
+            for future in futures:
+                future.result()
 
     def handle(self, *args, **options):
         bill_page_no = options.get("bill_page_no")
@@ -378,6 +495,13 @@ class Command(BaseCommand):
         else:
             self.created_since = ""
         self.today_date = datetime.today().date()
+        self.workers = max(options["workers"], 1)
+        self.requests_per_minute = options["requests_per_minute"]
+        self.token_buckets = {}
+        self.leased = False
+        self.fuzzy_names = options.get("fuzzy_names")
+        self.legislator_indexes = {}
+        self.legislator_index_lock = threading.Lock()
         self.api_key_obj = self.get_api_key()
         if not self.api_key_obj:
             raise Exception("No API is available")
@@ -387,28 +511,27 @@ class Command(BaseCommand):
             bill_id = options.get("bill_id")
             if bill_id:
                 bill_id_url = f"https://v3.openstates.org/bills/{bill_id}?include=sponsorships&include=abstracts&include=other_titles&include=other_identifiers&include=actions&include=sources&include=documents&include=versions&include=votes&include=related_bills&apikey={self.api_key}"
-                data = requests.get(bill_id_url)
-                time.sleep(5)
+                data = openstates_get(bill_id_url, self.get_token_bucket(self.api_key))
                 if data.status_code == 200:
                     resp = data.json()
-                    self.store_state_legislature_bill(resp)
+                    self.store_state_legislature_bills([resp])
             else:
                 if jurisdiction_id:
                     self.state_bill_update(jurisdiction_id, "", bill_page_no)
                 else:
                     while True:
                         state_jurisdictions_url = f"https://v3.openstates.org/jurisdictions?classification=state&page=1&per_page=52&apikey={self.api_key}"
-                        data = requests.get(state_jurisdictions_url)
-                        time.sleep(5)
+                        data = openstates_get(state_jurisdictions_url, self.get_token_bucket(self.api_key))
                         if data.status_code == 200:
                             resp = data.json()
                             data_contents = resp.get("results", [])
+                            jurisdictions = queue.Queue()
                             for data_content in data_contents:
                                 jurisdiction_id = data_content.get("id")
                                 state_name = data_content.get("name", "")
                                 if jurisdiction_id:
                                     if not self.get_state_bill_status(jurisdiction_id):
-                                        self.state_bill_update(jurisdiction_id, state_name, bill_page_no)
+                                        jurisdictions.put((jurisdiction_id, state_name, bill_page_no))
                                     else:
                                         self.stdout.write(
                                             self.style.ERROR(
@@ -419,18 +542,10 @@ class Command(BaseCommand):
                                     self.stdout.write(
                                         self.style.ERROR("jurisdiction id not found.")
                                     )
+                            self.crawl_jurisdictions(jurisdictions)
                             break
-                        elif data.status_code == 429:
-                            self.stdout.write(
-                                self.style.ERROR(f"ERROR: API key {self.api_key} expired")
-                            )
-                            self.api_key_obj.is_available = False
-                            self.api_key_obj.retired_time = self.today_date
-                            self.api_key_obj.save()
-                            self.api_key_obj = self.get_api_key()
-                            if not self.api_key_obj:
-                                raise Exception("No API Key is available")
-                            self.api_key = self.api_key_obj.key
+                        elif is_quota_spent(data):
+                            self.retire_api_key(self.api_key)
                             continue
                         else:
                             self.stdout.write(
@@ -438,4 +553,5 @@ class Command(BaseCommand):
                             )
                             break
 
+        self.stdout.write(self.style.SUCCESS(f"OpenStates {metrics.summary()}"))
         self.stdout.write(self.style.SUCCESS("Command ran successfully..."))
@@ -1,121 +1,141 @@
-from django.core.management import BaseCommand
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management import BaseCommand, CommandError
+from pdfminer.layout import LAParams
+
+from pdf2txt import ExtractionCache, default_cache_dir
+from todo.pdf_extraction import MIN_TEXT_CHARS, OCR_DPI, DocumentExtraction, iter_pdf_inputs
 
 
 class Command(BaseCommand):
+    """
+    extract the text of every pdf in a directory or glob
+
+    pages with a usable text layer are extracted directly, only the other pages
+    are rasterized and OCRed, one page at a time, in a process pool
+
+    finished documents are kept in the pdf2txt extraction cache, an unchanged pdf
+    is not extracted again
+
+    with --outdir the text of bills/2021/hb1.pdf given as bills/ is written to
+    bills_text/2021/hb1.txt, a pdf that cannot be extracted is reported and
+    skipped, the command fails at the end if any was
+
+    python manage.py pdf_file_issue bills/ --jobs=4 --outdir=bills_text
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", type=str, help="pdf files, directories or glob patterns")
+        parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="OCR worker processes")
+        parser.add_argument("--outdir", type=str,
+                            help="write <name>.txt per pdf here, at its path relative to the input, instead of stdout")
+        parser.add_argument("--min_chars", type=int, default=MIN_TEXT_CHARS,
+                            help="pages with fewer text layer characters are OCRed")
+        parser.add_argument("--dpi", type=int, default=OCR_DPI, help="resolution pages are rasterized at for OCR")
+        parser.add_argument("--fast", action="store_true", help="use the pdf2txt --fast layout profile")
+        parser.add_argument("--mmap", action="store_true", help="memory-map the pdf instead of buffered reads")
+        parser.add_argument("--cache_dir", type=str, default=default_cache_dir(),
+                            help="directory of the extraction cache shared with pdf2txt")
+        parser.add_argument("--cache_size", type=int, default=512, help="cache size limit in MB")
+        parser.add_argument("--no_cache", action="store_true", help="extract every pdf again")
+
+    def get_output_path(self, relname):
+        """
+        path of the text file of a pdf under outdir, None if an earlier pdf
+        already has it
+        :param relname:
+        :return:
+        """
+        path = os.path.join(self.outdir, os.path.splitext(relname)[0] + ".txt")
+        if path in self.output_paths:
+            return None
+        self.output_paths.add(path)
+        return path
+
+    def write_document(self, document, output_path):
+        """
+        write the text of a finished document, pages separated by form feeds
+        :param document:
+        :param output_path: None for stdout
+        :return:
+        """
+        text = "\f".join(document.result())
+        if output_path:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, "w") as fp:
+                fp.write(text)
+        else:
+            self.stdout.write(text)
+        self.log(f"{document.fname} pages: {document.page_count} OCR pages: {len(document.ocr_page_numbers)}")
+
+    def finish_document(self, document, output_path):
+        try:
+            self.write_document(document, output_path)
+        except Exception as e:
+            self.error(document.fname, e)
+
+    def error(self, fname, e):
+        self.failed += 1
+        self.stderr.write(f"{fname} not extracted -- {e}", style_func=self.style.ERROR)
+
+    def log(self, message):
+        """
+        progress goes to stderr while the text itself is written to stdout
+        :param message:
+        :return:
+        """
+        output = self.stdout if self.outdir else self.stderr
+        output.write(message, style_func=self.style.SUCCESS)
 
     def handle(self, *args, **options):
-        import PyPDF2
-
-        # creating a pdf file object
-        pdfFileObject = open(r"abc.pdf", 'rb')
-        pdfReader = PyPDF2.PdfFileReader(pdfFileObject)
-        print(" No. Of Pages :", pdfReader.numPages)
-        pageObject = pdfReader.getPage(0)
-        print(pageObject.extractText())
-
-        pdfFileObject.close()
-        # pdfFileObj = open('abc.pdf', 'rb')
-        #
-        # # creating a pdf reader object
-        # pdfReader = PyPDF2.PdfFileReader(pdfFileObj)
-        #
-        # # printing number of pages in pdf file
-        # print(pdfReader.numPages)
-        #
-        # # creating a page object
-        # pageObj = pdfReader.getPage(5)
-        #
-        # # extracting text from page
-        # print(pageObj.extractText())
-        #
-        # # closing the pdf file object
-        # pdfFileObj.close()
-        # from PIL import Image
-        # import pytesseract
-        # import sys
-        # from pdf2image import convert_from_path
-        # import os
-        # # Path of the pdf
-        # PDF_file = "abc.pdf"
-        # '''
-        # Part #1 : Converting PDF to images
-        # '''
-        # # Store all the pages of the PDF in a variable
-        # pages = convert_from_path(PDF_file, 500)
-        # # Counter to store images of each page of PDF to image
-        # image_counter = 1
-        #
-        # # Iterate through all the pages stored above
-        # for page in pages:
-        #     # Declaring filename for each page of PDF as JPG
-        #     # For each page, filename will be:
-        #     # PDF page 1 -> page_1.jpg
-        #     # PDF page 2 -> page_2.jpg
-        #     # PDF page 3 -> page_3.jpg
-        #     # ....
-        #     # PDF page n -> page_n.jpg
-        #     filename = "page_" + str(image_counter) + ".jpg"
-        #
-        #     # Save the image of the page in system
-        #     page.save(filename, 'JPEG')
-        #
-        #     # Increment the counter to update filename
-        #     image_counter = image_counter + 1
-        #
-        # '''
-        # Part #2 - Recognizing text from the images using OCR
-        # '''
-        # # 3
-        #
-        # # Variable to get count of total number of pages
-        # filelimit = image_counter - 1
-        #
-        # # Creating a text file to write the output
-        # outfile = "out_text.txt"
-        #
-        # # Open the file in append mode so that
-        # # All contents of all images are added to the same file
-        # f = open(outfile, "a")
-        #
-        # # Iterate from 1 to total number of pages
-        # for i in range(1, filelimit + 1):
-        #     # Set filename to recognize text from
-        #     # Again, these files will be:
-        #     # page_1.jpg
-        #     # page_2.jpg
-        #     # ....
-        #     # page_n.jpg
-        #     filename = "page_" + str(i) + ".jpg"
-        #
-        #     # Recognize the text as string in image using pytesserct
-        #     text = str(((pytesseract.image_to_string(Image.open(filename)))))
-        #
-        #     # The recognized text is stored in variable text
-        #     # Any string processing may be applied on text
-        #     # Here, basic formatting has been done:
-        #     # In many PDFs, at line ending, if a word can't
-        #     # be written fully, a 'hyphen' is added.
-        #     # The rest of the word is written in the next line
-        #     # Eg: This is a sample text this word here GeeksF-
-        #     # orGeeks is half on first line, remaining on next.
-        #     # To remove this, we replace every '-\n' to ''.
-        #     text = text.replace('-\n', '')
-        #
-        #     # Finally, write the processed text to the file.
-        #     f.write(text)
-        #     print(text)
-        #     print("\n\n")
-
-        # Close the file after writing all the text.
-        # f.close()
-
-        # cwd = os.getcwd()
-        # file_path = os.path.join(cwd, "abc.pdf")
-        # from pdfminer.high_level import extract_text
-        # text = extract_text(file_path)
-        #
-        # print(repr(text))
-        # import code
-        # code.interact(local=dict(**globals(), **locals()))
-        # pass
\ No newline at end of file
+        pdf_inputs = list(iter_pdf_inputs(options["paths"]))
+        if not pdf_inputs:
+            raise CommandError("No pdf file found.")
+        self.outdir = options.get("outdir")
+        if self.outdir:
+            os.makedirs(self.outdir, exist_ok=True)
+        self.output_paths = set()
+        self.failed = 0
+
+        jobs = max(options["jobs"] or 1, 1)
+        laparams = LAParams()
+        cache = None
+        if not options["no_cache"]:
+            cache = ExtractionCache(options["cache_dir"], options["cache_size"] * 1024 * 1024)
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for fname, relname in pdf_inputs:
+                output_path = None
+                if self.outdir:
+                    output_path = self.get_output_path(relname)
+                    if output_path is None:
+                        self.error(fname, f"an earlier pdf is already written to {relname}")
+                        continue
+                try:
+                    document = DocumentExtraction(
+                        fname,
+                        executor,
+                        laparams,
+                        min_chars=options["min_chars"],
+                        fast=options["fast"],
+                        use_mmap=options["mmap"],
+                        dpi=options["dpi"],
+                        cache=cache,
+                    )
+                except Exception as e:
+                    self.error(fname, e)
+                    continue
+                pending.append((document, output_path))
+                # documents are written in input order, at most 2 * jobs wait for OCR
+                while pending and (pending[0][0].done() or len(pending) > jobs * 2):
+                    self.finish_document(*pending.popleft())
+            while pending:
+                self.finish_document(*pending.popleft())
+
+        if cache is not None:
+            self.log(f"cache: {cache.hits} hits, {cache.misses} misses")
+        if self.failed:
+            raise CommandError(f"{self.failed} of {len(pdf_inputs)} pdf files not extracted.")
+        self.log("Command ran successfully...")
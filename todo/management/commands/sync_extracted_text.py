@@ -0,0 +1,165 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfminer
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from pdfminer.layout import LAParams
+
+from pdf2txt import file_sha256
+from todo.models import ExtractedDocument, ExtractedPage
+from todo.pdf_extraction import MIN_TEXT_CHARS, OCR_DPI, DocumentExtraction, find_pdfs
+
+
+class Command(BaseCommand):
+    """
+    store the extracted text of every pdf in a directory or glob
+
+    a pdf is only extracted again when its content hash or the extractor
+    parameters changed, an unchanged size and mtime skip hashing altogether,
+    so a nightly run costs in proportion to what changed
+
+    a pdf that cannot be extracted is reported and skipped, the command fails
+    at the end if any was
+
+    python manage.py sync_extracted_text bills/ --jobs=4
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", type=str, help="pdf files, directories or glob patterns")
+        parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="OCR worker processes")
+        parser.add_argument("--min_chars", type=int, default=MIN_TEXT_CHARS,
+                            help="pages with fewer text layer characters are OCRed")
+        parser.add_argument("--dpi", type=int, default=OCR_DPI, help="resolution pages are rasterized at for OCR")
+        parser.add_argument("--fast", action="store_true", help="use the pdf2txt --fast layout profile")
+        parser.add_argument("--mmap", action="store_true", help="memory-map the pdf instead of buffered reads")
+        parser.add_argument("--force", action="store_true", help="extract every pdf again")
+
+    def get_extractor_params(self, options):
+        return {
+            "pdfminer": pdfminer.__version__,
+            "laparams": vars(LAParams()),
+            "min_chars": options["min_chars"],
+            "dpi": options["dpi"],
+            "fast": options["fast"],
+        }
+
+    def needs_extraction(self, path, stat, document):
+        """
+        if the stored text of path is missing or stale, the hash is only
+        computed when the size or mtime moved
+        :param path:
+        :param stat:
+        :param document:
+        :return: (needs extraction, file hash or None)
+        """
+        if document is None or self.force or document.extractor_params != self.extractor_params:
+            return True, None
+        if document.file_size == stat.st_size and document.file_mtime == stat.st_mtime:
+            return False, None
+        file_hash = file_sha256(path, self.use_mmap)
+        if file_hash != document.file_hash:
+            return True, file_hash
+        # touched but not changed
+        document.file_size = stat.st_size
+        document.file_mtime = stat.st_mtime
+        document.save(update_fields=["file_size", "file_mtime"])
+        return False, file_hash
+
+    def store_document(self, extraction, stat, file_hash):
+        """
+        save the document and replace its pages
+        :param extraction:
+        :param stat:
+        :param file_hash:
+        :return:
+        """
+        pages = extraction.result()
+        ocr_page_numbers = set(extraction.ocr_page_numbers)
+        with transaction.atomic():
+            document = ExtractedDocument.objects.update_or_create(
+                path=extraction.fname,
+                defaults={
+                    "file_hash": file_hash or file_sha256(extraction.fname, self.use_mmap),
+                    "file_mtime": stat.st_mtime,
+                    "file_size": stat.st_size,
+                    "extractor_params": self.extractor_params,
+                    "page_count": len(pages),
+                    "ocr_page_count": len(ocr_page_numbers),
+                    "text": "\f".join(pages),
+                },
+            )[0]
+            document.pages.all().delete()
+            ExtractedPage.objects.bulk_create(
+                [
+                    ExtractedPage(
+                        document=document,
+                        page_number=page_number,
+                        text=text,
+                        ocr=page_number in ocr_page_numbers,
+                    )
+                    for page_number, text in enumerate(pages)
+                ]
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{document.path} pages: {document.page_count} OCR pages: {document.ocr_page_count}"
+            )
+        )
+
+    def finish_document(self, extraction, stat, file_hash):
+        try:
+            self.store_document(extraction, stat, file_hash)
+        except Exception as e:
+            self.error(extraction.fname, e)
+
+    def error(self, fname, e):
+        self.failed += 1
+        self.stderr.write(f"{fname} not extracted -- {e}", style_func=self.style.ERROR)
+
+    def handle(self, *args, **options):
+        paths = [os.path.abspath(path) for path in find_pdfs(options["paths"])]
+        if not paths:
+            raise CommandError("No pdf file found.")
+        self.force = options["force"]
+        self.use_mmap = options["mmap"]
+        self.extractor_params = self.get_extractor_params(options)
+        documents = ExtractedDocument.objects.in_bulk(paths, field_name="path")
+        self.failed = 0
+
+        jobs = max(options["jobs"] or 1, 1)
+        laparams = LAParams()
+        skipped = 0
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                    extract, file_hash = self.needs_extraction(path, stat, documents.get(path))
+                    if not extract:
+                        skipped += 1
+                        continue
+                    extraction = DocumentExtraction(
+                        path,
+                        executor,
+                        laparams,
+                        min_chars=options["min_chars"],
+                        fast=options["fast"],
+                        use_mmap=self.use_mmap,
+                        dpi=options["dpi"],
+                    )
+                except Exception as e:
+                    self.error(path, e)
+                    continue
+                pending.append((extraction, stat, file_hash))
+                # at most 2 * jobs documents wait for OCR
+                while pending and (pending[0][0].done() or len(pending) > jobs * 2):
+                    self.finish_document(*pending.popleft())
+            while pending:
+                self.finish_document(*pending.popleft())
+
+        self.stdout.write(self.style.SUCCESS(f"Unchanged documents skipped: {skipped}"))
+        if self.failed:
+            raise CommandError(f"{self.failed} of {len(paths)} pdf files not extracted.")
+        self.stdout.write(self.style.SUCCESS("Command ran successfully..."))
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['todo_creation', 'id'], name='todo_creation_id_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:40
+
+from django.db import migrations
+
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE todo_todo_fts USING fts5(
+        todo_tile, todo_description, content='todo_todo', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER todo_todo_fts_insert AFTER INSERT ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(rowid, todo_tile, todo_description)
+        VALUES (new.id, new.todo_tile, new.todo_description);
+    END
+    """,
+    """
+    CREATE TRIGGER todo_todo_fts_delete AFTER DELETE ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(todo_todo_fts, rowid, todo_tile, todo_description)
+        VALUES ('delete', old.id, old.todo_tile, old.todo_description);
+    END
+    """,
+    """
+    CREATE TRIGGER todo_todo_fts_update AFTER UPDATE OF todo_tile, todo_description ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(todo_todo_fts, rowid, todo_tile, todo_description)
+        VALUES ('delete', old.id, old.todo_tile, old.todo_description);
+        INSERT INTO todo_todo_fts(rowid, todo_tile, todo_description)
+        VALUES (new.id, new.todo_tile, new.todo_description);
+    END
+    """,
+    "INSERT INTO todo_todo_fts(todo_todo_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS todo_todo_fts_update",
+    "DROP TRIGGER IF EXISTS todo_todo_fts_delete",
+    "DROP TRIGGER IF EXISTS todo_todo_fts_insert",
+    "DROP TABLE IF EXISTS todo_todo_fts",
+]
+
+
+def run_sqlite(statements):
+    """
+    the full text index is sqlite only, other databases search with icontains
+    """
+
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0003_todo_updated_at_todotombstone'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FTS_SQL), run_sqlite(DROP_FTS_SQL)),
+    ]
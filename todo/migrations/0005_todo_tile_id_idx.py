@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0004_todo_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['todo_tile', 'id'], name='todo_tile_id_idx'),
+        ),
+    ]
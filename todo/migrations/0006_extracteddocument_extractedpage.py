@@ -0,0 +1,46 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0005_todo_tile_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, unique=True)),
+                ('file_hash', models.CharField(max_length=64)),
+                ('file_mtime', models.FloatField()),
+                ('file_size', models.BigIntegerField()),
+                ('extractor_params', models.JSONField(default=dict)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('ocr_page_count', models.PositiveIntegerField(default=0)),
+                ('text', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExtractedPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('ocr', models.BooleanField(default=False)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='todo.extracteddocument')),
+            ],
+            options={
+                'ordering': ['page_number'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='extractedpage',
+            constraint=models.UniqueConstraint(fields=('document', 'page_number'), name='extracted_page_unique'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+def create_sync_counter(apps, schema_editor):
+    TodoSyncCounter = apps.get_model("todo", "TodoSyncCounter")
+    TodoSyncCounter.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0006_extracteddocument_extractedpage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoSyncCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='todotombstone',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(create_sync_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.0.4 on 2026-10-18 14:05
+
+from django.db import migrations
+
+# the AddField of 0007 rebuilt todo_todo on sqlite, which drops the triggers
+# keeping todo_todo_fts in sync, they are created again and the index rebuilt
+# from the rows written since
+FTS_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_todo_fts_insert AFTER INSERT ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(rowid, todo_tile, todo_description)
+        VALUES (new.id, new.todo_tile, new.todo_description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_todo_fts_delete AFTER DELETE ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(todo_todo_fts, rowid, todo_tile, todo_description)
+        VALUES ('delete', old.id, old.todo_tile, old.todo_description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_todo_fts_update AFTER UPDATE OF todo_tile, todo_description ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(todo_todo_fts, rowid, todo_tile, todo_description)
+        VALUES ('delete', old.id, old.todo_tile, old.todo_description);
+        INSERT INTO todo_todo_fts(rowid, todo_tile, todo_description)
+        VALUES (new.id, new.todo_tile, new.todo_description);
+    END
+    """,
+    "INSERT INTO todo_todo_fts(todo_todo_fts) VALUES ('rebuild')",
+]
+
+
+def create_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in FTS_TRIGGERS_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0007_todo_sync_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,99 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
 
 # Create your models here.
 
 
+class TodoSyncCounter(models.Model):
+    """
+    single row counting todo writes for delta sync
+    the row stays locked by the writing transaction until it commits, so versions
+    are handed out in commit order and every version up to the committed value is
+    visible to readers
+    """
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def next_version(cls):
+        """
+        next version, must run inside the transaction writing the rows it stamps
+        :return:
+        """
+        if not cls.objects.filter(pk=1).update(value=F("value") + 1):
+            cls.objects.create(pk=1, value=1)
+        return cls.objects.values_list("value", flat=True).get(pk=1)
+
+    @classmethod
+    def current_version(cls):
+        return cls.objects.filter(pk=1).values_list("value", flat=True).first() or 0
+
+
 class Todo(models.Model):
     todo_tile = models.CharField(max_length=20)
     todo_description = models.TextField()
     todo_creation = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    sync_version = models.BigIntegerField(default=0, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["todo_creation", "id"], name="todo_creation_id_idx"),
+            models.Index(fields=["todo_tile", "id"], name="todo_tile_id_idx"),
+        ]
 
     def __str__(self):
         return self.todo_tile
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            self.sync_version = TodoSyncCounter.next_version()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "sync_version"}
+            super().save(*args, **kwargs)
+
+
+class TodoTombstone(models.Model):
+    """
+    marker left behind by a deleted todo, so delta sync clients can drop it
+    """
+    todo_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    sync_version = models.BigIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return str(self.todo_id)
+
+
+class ExtractedDocument(models.Model):
+    """
+    text extracted from a pdf, with what is needed to tell if it is stale
+    """
+    path = models.CharField(max_length=1024, unique=True)
+    file_hash = models.CharField(max_length=64)
+    file_mtime = models.FloatField()
+    file_size = models.BigIntegerField()
+    extractor_params = models.JSONField(default=dict)
+    page_count = models.PositiveIntegerField(default=0)
+    ocr_page_count = models.PositiveIntegerField(default=0)
+    text = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.path
+
+
+class ExtractedPage(models.Model):
+    document = models.ForeignKey(ExtractedDocument, related_name="pages", on_delete=models.CASCADE)
+    page_number = models.PositiveIntegerField()
+    text = models.TextField(blank=True)
+    ocr = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["page_number"]
+        constraints = [
+            models.UniqueConstraint(fields=["document", "page_number"], name="extracted_page_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.document} page {self.page_number + 1}"
@@ -0,0 +1,232 @@
+import statistics
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# default quota of an openstates api key
+REQUESTS_PER_MINUTE = 10
+# (connect, read) seconds
+REQUEST_TIMEOUT = (10, 60)
+# connections kept alive, one per thread fetching at the same time is enough
+POOL_MAXSIZE = 32
+# connection errors are retried by the adapter after 1, 2, 4 seconds, before any
+# request reaches the api, so they take no token
+CONNECT_RETRIES = Retry(
+    total=3,
+    connect=3,
+    read=0,
+    status=0,
+    other=0,
+    backoff_factor=1,
+    status_forcelist=(),
+    allowed_methods=("GET",),
+    respect_retry_after_header=False,
+    raise_on_status=False,
+)
+# 5xx responses and timeouts are retried by openstates_get after 1, 2, 4... seconds,
+# every attempt takes a token
+SERVER_ERROR_STATUSES = (500, 502, 503, 504)
+SERVER_ERROR_BACKOFF = 1
+# a 429 asking to wait longer than this means the daily quota of the key is spent
+MAX_RETRY_AFTER = 300
+MAX_RETRIES = 5
+
+
+class APIKeySpent(Exception):
+    """the daily quota of an api key is spent"""
+
+
+class TokenBucket:
+    """
+    thread safe rate limiter, every request takes a token, tokens are refilled
+    at rate per second up to capacity, so at most capacity requests go out at once
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        # tokens is the balance at updated, which is in the future during a pause
+        self.updated = time.monotonic()
+        self.pauses = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        take a token, blocks until the token is available, callers are served
+        in the order they arrive
+        :return: seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now > self.updated:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                self.tokens -= 1
+                wait = self.updated - now + max(-self.tokens / self.rate, 0)
+                pauses = self.pauses
+            if wait:
+                time.sleep(wait)
+                waited += wait
+            with self.lock:
+                if self.pauses == pauses:
+                    return waited
+            # paused while waiting, the token was given back by pause, queue again
+
+    def pause(self, seconds):
+        """
+        no token is handed out for seconds, used when the provider asks to retry
+        later, callers waiting for a token queue again and go out at rate after
+        the pause rather than all at once when it ends
+        :param seconds:
+        :return:
+        """
+        with self.lock:
+            self.updated = max(self.updated, time.monotonic() + seconds)
+            # the tokens owed are those of the callers queueing again
+            self.tokens = 0
+            self.pauses += 1
+
+
+def parse_retry_after(value):
+    """
+    seconds to wait from a Retry-After header, which holds seconds or an http date
+    :param value:
+    :return: seconds or None
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestMetrics:
+    """
+    thread safe timing of the requests made through openstates_get
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = []
+        self.status_codes = Counter()
+        self.errors = 0
+        self.rate_limit_wait = 0.0
+        self.bytes = 0
+
+    def record(self, elapsed, response=None, rate_limit_wait=0.0):
+        with self.lock:
+            self.timings.append(elapsed)
+            self.rate_limit_wait += rate_limit_wait
+            if response is None:
+                self.errors += 1
+            else:
+                self.status_codes[response.status_code] += 1
+                self.bytes += get_downloaded_bytes(response)
+
+    def summary(self):
+        with self.lock:
+            if not self.timings:
+                return "requests: 0"
+            timings = sorted(self.timings)
+            status_codes = ", ".join(f"{code}: {count}" for code, count in sorted(self.status_codes.items()))
+            return (
+                f"requests: {len(timings)} status codes: {status_codes} errors: {self.errors} "
+                f"mean: {statistics.mean(timings):.2f}s p95: {timings[int(len(timings) * 0.95)]:.2f}s "
+                f"max: {timings[-1]:.2f}s rate limit wait: {self.rate_limit_wait:.0f}s "
+                f"downloaded: {self.bytes / 1024 / 1024:.1f}MB"
+            )
+
+
+def get_downloaded_bytes(response):
+    """
+    bytes of the response body read off the wire, compressed as it was sent
+    :param response:
+    :return:
+    """
+    try:
+        return response.raw.tell()
+    except AttributeError:
+        return len(response.content)
+
+
+metrics = RequestMetrics()
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    the session shared by every thread, connections to the api are kept alive
+    and pooled, responses are gzip compressed
+    :return:
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE, max_retries=CONNECT_RETRIES)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            _session = session
+        return _session
+
+
+def is_quota_spent(response):
+    """
+    if the response is a 429 for a key whose quota is spent rather than a
+    request to slow down
+    :param response:
+    :return:
+    """
+    if response.status_code != 429:
+        return False
+    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+    return retry_after is None or retry_after > MAX_RETRY_AFTER
+
+
+def openstates_get(url, bucket):
+    """
+    rate limited GET, a 429 with a short Retry-After is retried after waiting,
+    5xx responses and timeouts are retried with backoff, any other response,
+    a 429 of a spent key included, is returned to the caller
+    :param url:
+    :param bucket:
+    :return:
+    """
+    session = get_session()
+    for attempt in range(MAX_RETRIES):
+        last_attempt = attempt == MAX_RETRIES - 1
+        rate_limit_wait = bucket.acquire()
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            metrics.record(time.perf_counter() - start, rate_limit_wait=rate_limit_wait)
+            if last_attempt or not isinstance(e, requests.Timeout):
+                raise
+            time.sleep(SERVER_ERROR_BACKOFF * 2 ** attempt)
+            continue
+        metrics.record(time.perf_counter() - start, response, rate_limit_wait)
+        if response.status_code in SERVER_ERROR_STATUSES:
+            if last_attempt:
+                return response
+            time.sleep(SERVER_ERROR_BACKOFF * 2 ** attempt)
+        elif response.status_code != 429 or is_quota_spent(response):
+            return response
+        else:
+            bucket.pause(parse_retry_after(response.headers["Retry-After"]))
+    return response
@@ -0,0 +1,186 @@
+import glob
+import io
+import json
+import os
+import subprocess
+
+from pdf2txt import CID_RE, iter_pages, looks_garbled
+
+# a page whose text layer has fewer visible characters than this is OCRed
+MIN_TEXT_CHARS = 25
+OCR_DPI = 300
+# pages of one document handed to an OCR worker at a time
+OCR_CHUNK_PAGES = 8
+
+
+def iter_pdf_inputs(paths):
+    """
+    pdf files named by paths with their name relative to the path that named
+    them, every path is a file, a directory (searched recursively) or a glob
+    pattern, relative to the directory before its first wildcard
+    :param paths:
+    :return: (file name, relative name) pairs
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for fname in sorted(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True)):
+                yield fname, os.path.relpath(fname, path)
+        elif glob.has_magic(path):
+            root = os.path.dirname(path)
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+            for fname in sorted(glob.glob(path, recursive=True)):
+                yield fname, os.path.relpath(fname, root or os.curdir)
+        else:
+            yield path, os.path.basename(path)
+
+
+def find_pdfs(paths):
+    """
+    pdf files named by paths, see iter_pdf_inputs
+    :param paths:
+    :return:
+    """
+    return [fname for fname, _ in iter_pdf_inputs(paths)]
+
+
+def has_text_layer(text, min_chars=MIN_TEXT_CHARS):
+    """
+    if the extracted text of a page is usable, glyphs without a unicode
+    mapping come out as (cid:N) and do not count
+    :param text:
+    :param min_chars:
+    :return:
+    """
+    visible_chars = len("".join(CID_RE.sub("", text).split()))
+    return visible_chars >= min_chars and not looks_garbled(text)
+
+
+def clean_ocr_text(text):
+    # words hyphenated at a line end are joined again
+    return text.replace("-\n", "")
+
+
+def iter_page_images(fname, page_numbers, dpi=OCR_DPI):
+    """
+    rasterize the given zero-indexed pages one at a time, every image is
+    closed before the next page is rendered, so memory does not grow with
+    the length of the document
+    :param fname:
+    :param page_numbers:
+    :param dpi:
+    :return:
+    """
+    from pdf2image import convert_from_path
+
+    for page_number in sorted(page_numbers):
+        image = convert_from_path(
+            fname, dpi, first_page=page_number + 1, last_page=page_number + 1, grayscale=True
+        )[0]
+        try:
+            yield page_number, image
+        finally:
+            image.close()
+
+
+def tesseract_image(image, dpi=OCR_DPI):
+    """
+    OCR an image by piping it to tesseract, pytesseract round-trips every
+    image through temp files
+    :param image:
+    :param dpi:
+    :return:
+    """
+    import pytesseract
+
+    buffer = io.BytesIO()
+    image.save(buffer, "PPM")
+    result = subprocess.run(
+        [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout", "--dpi", str(dpi)],
+        input=buffer.getvalue(),
+        capture_output=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"tesseract failed: {result.stderr.decode(errors='replace')}")
+    return result.stdout.decode("utf-8")
+
+
+def ocr_pages(fname, page_numbers, dpi=OCR_DPI):
+    """
+    OCR the given zero-indexed pages of fname, runs in a worker process
+    :param fname:
+    :param page_numbers:
+    :param dpi:
+    :return: {page_number: text}
+    """
+    return {
+        page_number: clean_ocr_text(tesseract_image(image, dpi))
+        for page_number, image in iter_page_images(fname, page_numbers, dpi)
+    }
+
+
+class DocumentExtraction:
+    """
+    text of one pdf, pages with a usable text layer are read directly and the
+    rest is OCRed in the executor
+
+    with a pdf2txt ExtractionCache the finished pages are stored under the
+    content hash of the pdf and the extraction parameters, a document seen
+    before is neither parsed nor OCRed again
+    """
+
+    def __init__(self, fname, executor, laparams=None, min_chars=MIN_TEXT_CHARS, fast=False, use_mmap=False,
+                 dpi=OCR_DPI, cache=None):
+        self.fname = fname
+        self.pages = {}
+        self.ocr_page_numbers = []
+        self.ocr_futures = []
+        self.cache = cache
+        self.cache_key = None
+        if cache is not None:
+            params = {
+                "document": sorted(vars(laparams).items()) if laparams is not None else None,
+                "min_chars": min_chars,
+                "fast": fast,
+                "dpi": dpi,
+            }
+            self.cache_key = cache.make_key(fname, sorted(params.items()), use_mmap)
+            cached = cache.get(self.cache_key)
+            if cached is not None:
+                cached = json.loads(cached)
+                self.pages = dict(enumerate(cached["pages"]))
+                self.ocr_page_numbers = cached["ocr_page_numbers"]
+                self.page_count = len(self.pages)
+                # nothing to store again
+                self.cache = None
+                return
+
+        for page_number, text in iter_pages(fname, laparams, fast=fast, use_mmap=use_mmap):
+            if has_text_layer(text, min_chars):
+                self.pages[page_number] = text
+            else:
+                self.ocr_page_numbers.append(page_number)
+        self.page_count = len(self.pages) + len(self.ocr_page_numbers)
+        self.ocr_futures = [
+            executor.submit(ocr_pages, fname, self.ocr_page_numbers[i:i + OCR_CHUNK_PAGES], dpi)
+            for i in range(0, len(self.ocr_page_numbers), OCR_CHUNK_PAGES)
+        ]
+
+    def done(self):
+        return all(future.done() for future in self.ocr_futures)
+
+    def result(self):
+        """
+        page texts in page order, waits for the OCR pages
+        :return:
+        """
+        for future in self.ocr_futures:
+            self.pages.update(future.result())
+        self.ocr_futures = []
+        pages = [self.pages.get(page_number, "") for page_number in range(self.page_count)]
+        if self.cache is not None:
+            self.cache.put(
+                self.cache_key, json.dumps({"pages": pages, "ocr_page_numbers": self.ocr_page_numbers}).encode()
+            )
+            self.cache = None
+        return pages
@@ -0,0 +1,66 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from todo.models import Todo
+
+FTS_TABLE = "todo_todo_fts"
+# bm25 column weights, a hit in the title counts twice a hit in the description
+FTS_RANK = f"bm25({FTS_TABLE}, 2.0, 1.0)"
+
+
+def get_search_terms(query):
+    return re.findall(r"\w+", query)
+
+
+def build_match_expression(terms):
+    """
+    every term is quoted and used as a prefix, all terms have to match
+    e.g. "buy mil" -> "buy"* "mil"*
+    :param terms:
+    :return:
+    """
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_todo_ids_icontains(terms, limit):
+    """
+    todo ids matching every term in the title or description, newest first,
+    the search of databases without a full text index
+    :param terms:
+    :param limit:
+    :return:
+    """
+    condition = Q()
+    for term in terms:
+        condition &= Q(todo_tile__icontains=term) | Q(todo_description__icontains=term)
+    return list(Todo.objects.filter(condition).order_by("-id").values_list("id", flat=True)[:limit])
+
+
+def search_todo_ids(query, limit):
+    """
+    todo ids matching query, best match first
+    :param query:
+    :param limit:
+    :return:
+    """
+    terms = get_search_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor != "sqlite":
+        return search_todo_ids_icontains(terms, limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY {FTS_RANK} LIMIT %s",
+            [build_match_expression(terms), limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_todos(query, limit=50):
+    todo_ids = search_todo_ids(query, limit)
+    todos = Todo.objects.in_bulk(todo_ids)
+    return [todos[todo_id] for todo_id in todo_ids if todo_id in todos]
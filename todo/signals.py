@@ -0,0 +1,22 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from todo.api.cache import invalidate_todos
+from todo.models import Todo, TodoSyncCounter, TodoTombstone
+
+
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+def todo_changed(sender, instance, **kwargs):
+    # a read between the invalidation and the commit would cache the old row again
+    transaction.on_commit(partial(invalidate_todos, [instance.pk]))
+
+
+@receiver(post_delete, sender=Todo)
+def todo_deleted(sender, instance, **kwargs):
+    # post_delete runs inside the delete transaction, the bulk delete endpoint
+    # writes the tombstones of its batches itself
+    TodoTombstone.objects.create(todo_id=instance.pk, sync_version=TodoSyncCounter.next_version())
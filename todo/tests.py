@@ -1,3 +1,896 @@
-from django.test import TestCase
+import filecmp
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, models
+from django.test import Client, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+import pdf2txt
+from todo import openstates
+from todo.api.serializers import TodoReadSerializer, TodoSerializer
+from todo.bill_actions import store_bill_actions
+from todo.api.views import TodoViewSet
+from todo.legislators import LegislatorNameIndex
+from todo.management.commands import sync_extracted_text
+from todo.models import ExtractedDocument, Todo, TodoTombstone
 
 # Create your tests here.
+
+
+def write_text_pdf(path, text):
+    """
+    one page pdf with text in its text layer, so nothing is OCRed
+    """
+    stream = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp:
+        fp.write(pdf)
+
+
+def create_todos(count, **kwargs):
+    return [
+        Todo.objects.create(
+            todo_tile=kwargs.get("todo_tile", f"todo {i}"),
+            todo_description="description",
+            todo_creation=f"2022-05-{i % 28 + 1:02d}T10:00:00Z",
+        )
+        for i in range(count)
+    ]
+
+
+class TodoCursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_ACCEPT="application/json")
+        # todo i and i + 28 are created at the same time, the cursor has to break the tie on id
+        self.todos = create_todos(60)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url).json()
+            ids.extend(todo["id"] for todo in response["results"])
+            url = response["next"]
+        return ids
+
+    def test_pages_cover_every_todo_once(self):
+        for ordering, key in [
+            ("", lambda todo: (todo.todo_creation, todo.pk)),
+            ("&ordering=todo_tile", lambda todo: (todo.todo_tile, todo.pk)),
+            ("&ordering=-id", lambda todo: -todo.pk),
+        ]:
+            with self.subTest(ordering):
+                ids = self.walk(f"/todo/todo/?page_size=7{ordering}")
+                self.assertEqual(ids, [todo.pk for todo in sorted(self.todos, key=key)])
+
+    def test_previous_pages_mirror_next_pages(self):
+        pages = []
+        url = "/todo/todo/?page_size=7"
+        while url:
+            response = self.client.get(url).json()
+            pages.append([todo["id"] for todo in response["results"]])
+            last = response
+            url = response["next"]
+        url = last["previous"]
+        for page in reversed(pages[:-1]):
+            response = self.client.get(url).json()
+            self.assertEqual([todo["id"] for todo in response["results"]], page)
+            url = response["previous"]
+        self.assertIsNone(url)
+
+    def test_cursors_are_stable_under_writes(self):
+        ordered = [todo.pk for todo in sorted(self.todos, key=lambda todo: (todo.todo_creation, todo.pk))]
+        response = self.client.get("/todo/todo/?page_size=10").json()
+        seen = [todo["id"] for todo in response["results"]]
+        # rows written before and after the cursor position while the client pages
+        Todo.objects.create(todo_tile="earlier", todo_description="", todo_creation="2022-04-01T00:00:00Z")
+        Todo.objects.create(todo_tile="later", todo_description="", todo_creation="2022-06-01T00:00:00Z")
+        Todo.objects.filter(pk=ordered[-1]).delete()
+        seen.extend(self.walk(response["next"]))
+        self.assertEqual(seen, ordered[:-1] + [Todo.objects.get(todo_tile="later").pk])
+        self.assertEqual(len(seen), len(set(seen)))
+
+
+class TodoChangesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_changes_since_token(self):
+        todos = create_todos(3)
+        response = self.client.get("/todo/todo/changes/").json()
+        self.assertEqual([todo["id"] for todo in response["updated"]], [todo.pk for todo in todos])
+        token = response["token"]
+
+        self.client.patch("/todo/todo/bulk/", [{"id": todos[0].pk, "todo_tile": "bulk"}], format="json")
+        self.client.delete(f"/todo/todo/{todos[1].pk}/")
+        response = self.client.get(f"/todo/todo/changes/?since={token}").json()
+        self.assertEqual([todo["id"] for todo in response["updated"]], [todos[0].pk])
+        self.assertEqual(response["deleted"], [todos[1].pk])
+
+        response = self.client.get(f"/todo/todo/changes/?since={response['token']}").json()
+        self.assertEqual((response["updated"], response["deleted"]), ([], []))
+
+    def test_bulk_delete_writes_tombstones_per_batch(self):
+        token = self.client.get("/todo/todo/changes/").json()["token"]
+        todos = create_todos(100)
+        ids = [todo.pk for todo in todos]
+        with self.assertNumQueries(7):
+            response = self.client.delete("/todo/todo/bulk/?batch_size=500", [*ids, 0], format="json")
+        self.assertEqual(response.json()[-1], {"id": 0, "deleted": False})
+        self.assertEqual(Todo.objects.count(), 0)
+        self.assertEqual(TodoTombstone.objects.values("sync_version").distinct().count(), 1)
+        response = self.client.get(f"/todo/todo/changes/?since={token}").json()
+        self.assertEqual(sorted(response["deleted"]), ids)
+
+        todos = create_todos(100)
+        # savepoint, release and the sync version, then a query to read the ids,
+        # delete the rows and write the tombstones per batch of 50
+        with self.assertNumQueries(4 + 2 * 3):
+            self.client.delete("/todo/todo/bulk/?batch_size=50", [todo.pk for todo in todos], format="json")
+
+    def test_token_ahead_of_the_counter_is_rejected(self):
+        create_todos(1)
+        response = self.client.get("/todo/todo/changes/?since=1666000000000000")
+        self.assertEqual(response.status_code, 400)
+
+
+class TodoBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient(HTTP_ACCEPT="application/json")
+
+    def item(self, todo_tile):
+        return {"todo_tile": todo_tile, "todo_description": "description", "todo_creation": "2022-05-03T10:00:00Z"}
+
+    def test_bulk_create(self):
+        items = [self.item(f"todo {i}") for i in range(5)]
+        response = self.client.post("/todo/todo/bulk/?batch_size=2", items, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([todo["todo_tile"] for todo in response.json()], [f"todo {i}" for i in range(5)])
+        self.assertEqual(
+            sorted(todo["id"] for todo in response.json()), sorted(Todo.objects.values_list("id", flat=True))
+        )
+        self.assertEqual(Todo.objects.values("sync_version").distinct().count(), 1)
+
+        response = self.client.post("/todo/todo/bulk/", [self.item("valid"), self.item("x" * 21)], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn("todo_tile", response.json()[1])
+        self.assertEqual(Todo.objects.count(), 5)
+
+    def test_bulk_create_from_ndjson(self):
+        body = "\n".join(json.dumps(self.item(f"todo {i}")) for i in range(3)) + "\n\n"
+        response = self.client.post("/todo/todo/bulk/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Todo.objects.count(), 3)
+
+        body = json.dumps(self.item("valid")) + "\n{not json\n"
+        response = self.client.post("/todo/todo/bulk/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("line 2", response.json()["detail"])
+        self.assertEqual(Todo.objects.count(), 3)
+
+    def test_bulk_update(self):
+        todos = create_todos(3)
+        response = self.client.put(
+            "/todo/todo/bulk/",
+            [{"id": todo.pk, **self.item(f"put {todo.pk}")} for todo in todos],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch("/todo/todo/bulk/", [{"id": todos[0].pk, "todo_tile": "patched"}], format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Todo.objects.order_by("id").values_list("todo_tile", flat=True)),
+            ["patched", f"put {todos[1].pk}", f"put {todos[2].pk}"],
+        )
+
+    def test_bulk_update_rejects_bad_ids(self):
+        todo = create_todos(1)[0]
+        for data, errors in [
+            ([{"id": todo.pk, "todo_tile": "u"}, {"id": todo.pk, "todo_tile": "v"}], [{}, {"id": ["Duplicate id."]}]),
+            ([{"id": todo.pk, "todo_tile": "u"}, {"id": 0, "todo_tile": "v"}], [{}, {"id": ["Not found."]}]),
+            ([{"id": [todo.pk], "todo_tile": "u"}, {"todo_tile": "v"}], [{"id": ["A valid integer is required."]}] * 2),
+        ]:
+            with self.subTest(data):
+                response = self.client.patch("/todo/todo/bulk/", data, format="json")
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), errors)
+        self.assertEqual(Todo.objects.get().todo_tile, "todo 0")
+
+    def test_bulk_update_reads_the_rows_in_its_transaction(self):
+        todo = create_todos(1)[0]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch("/todo/todo/bulk/", [{"id": todo.pk, "todo_tile": "u"}], format="json")
+        sql = [query["sql"] for query in queries.captured_queries]
+        self.assertTrue(sql[0].startswith("SAVEPOINT"), sql)
+        self.assertTrue(sql[-1].startswith("RELEASE SAVEPOINT"), sql)
+
+    def test_bulk_delete(self):
+        todos = create_todos(2)
+        response = self.client.delete("/todo/todo/bulk/", [todos[0].pk, todos[0].pk], format="json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.delete("/todo/todo/bulk/", [todos[0].pk, 0], format="json")
+        self.assertEqual(response.json(), [{"id": todos[0].pk, "deleted": True}, {"id": 0, "deleted": False}])
+        self.assertEqual(list(Todo.objects.values_list("id", flat=True)), [todos[1].pk])
+
+
+class TodoExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.todos = create_todos(5)
+
+    def export(self, query_string="", accept="application/x-ndjson"):
+        response = self.client.get(f"/todo/todo/export/?{query_string}", HTTP_ACCEPT=accept)
+        self.assertEqual(response.status_code, 200, query_string)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return b"".join(response.streaming_content).decode()
+
+    def export_ids(self, query_string):
+        return [json.loads(line)["id"] for line in self.export(query_string).splitlines()]
+
+    def test_every_todo_is_a_line(self):
+        todo = self.todos[0]
+        todo.todo_description = "line\u2028break \u00e9"
+        todo.save()
+        lines = self.export().splitlines(keepends=True)
+        self.assertTrue(all(line.endswith("\n") for line in lines))
+        self.assertEqual(
+            [json.loads(line) for line in self.export().split("\n") if line],
+            TodoSerializer(Todo.objects.order_by("id"), many=True).data,
+        )
+        for accept in ["application/json", "*/*"]:
+            self.assertEqual(len(self.export(accept=accept).split("\n")[:-1]), 5)
+
+    def test_incremental_filters(self):
+        ids = [todo.pk for todo in self.todos]
+        self.assertEqual(self.export_ids(f"min_id={ids[1]}"), ids[1:])
+        self.assertEqual(self.export_ids(f"max_id={ids[2]}"), ids[:3])
+        self.assertEqual(self.export_ids(f"min_id={ids[1]}&max_id={ids[3]}"), ids[1:4])
+        # todo i is created on 2022-05-(i + 1)
+        self.assertEqual(self.export_ids("created_since=2022-05-03T00:00:00Z"), ids[2:])
+        self.assertEqual(self.export_ids(f"created_since=2022-05-03T00:00:00Z&max_id={ids[3]}"), ids[2:4])
+
+    def test_invalid_filters_are_rejected(self):
+        for query_string in ["min_id=x", "max_id=-1", "created_since=yesterday"]:
+            with self.subTest(query_string):
+                response = self.client.get(f"/todo/todo/export/?{query_string}", HTTP_ACCEPT="application/x-ndjson")
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(len(response.content.splitlines()), 1)
+                json.loads(response.content)
+
+
+class TodoFastSerializerTests(TestCase):
+    def test_fast_list_is_byte_identical(self):
+        tz = timezone.get_fixed_timezone(330)
+        for i, (todo_creation, todo_description) in enumerate([
+            (datetime(2022, 5, 3, 10, 0, tzinfo=timezone.utc), "plain"),
+            (datetime(2022, 5, 3, 10, 0, 0, 123456, tzinfo=timezone.utc), "micro\u2028seconds\u2029"),
+            (datetime(2022, 5, 3, 23, 59, 59, 1, tzinfo=tz), 'quote " backslash \\ tab \t'),
+            (datetime(1999, 12, 31, 0, 0, 0, 999999, tzinfo=tz), "\u00e9\u4e2d\U0001f600 \x00"),
+        ]):
+            Todo.objects.create(
+                todo_tile=f"todo {i}\u2028", todo_description=todo_description, todo_creation=todo_creation
+            )
+        client = APIClient(HTTP_ACCEPT="application/json")
+        for ordering in ["", "&ordering=-id", "&ordering=todo_tile&page_size=2"]:
+            with self.subTest(ordering):
+                cache.clear()
+                default = client.get(f"/todo/todo/?page_size=10{ordering}")
+                fast = client.get(f"/todo/todo/?serializer=fast&page_size=10{ordering}")
+                self.assertEqual(default.status_code, 200)
+                self.assertIn(b"\\u2028", default.content)
+                # the cursor links carry the serializer param
+                fast_content = fast.content.replace(b"serializer=fast&", b"").replace(b"&serializer=fast", b"")
+                self.assertEqual(fast_content, default.content)
+
+
+class TodoCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_ACCEPT="application/json")
+        self.todos = create_todos(3)
+
+    def get_title(self, path):
+        return self.client.get(path).json()["todo_tile"]
+
+    def test_list_pages_are_cached_per_host(self):
+        self.client.get("/todo/todo/?page_size=1", HTTP_HOST="evil.example")
+        response = self.client.get("/todo/todo/?page_size=1", HTTP_HOST="api.real.example")
+        self.assertTrue(response.json()["next"].startswith("http://api.real.example/todo/todo/?cursor="))
+
+    def test_writes_invalidate_once_committed(self):
+        todo = self.todos[0]
+        self.assertEqual(self.client.get("/todo/todo/").json()["results"][0]["todo_tile"], "todo 0")
+        self.assertEqual(self.get_title(f"/todo/todo/{todo.pk}/"), "todo 0")
+        with self.captureOnCommitCallbacks() as callbacks:
+            todo.todo_tile = "changed"
+            todo.save()
+        # until the commit other requests still read the old row, so the cache keeps it
+        self.assertEqual(self.get_title(f"/todo/todo/{todo.pk}/"), "todo 0")
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.get_title(f"/todo/todo/{todo.pk}/"), "changed")
+        self.assertEqual(self.client.get("/todo/todo/").json()["results"][0]["todo_tile"], "changed")
+
+    def test_bulk_writes_invalidate(self):
+        todo = self.todos[0]
+        self.assertEqual(self.get_title(f"/todo/todo/{todo.pk}/"), "todo 0")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch("/todo/todo/bulk/", [{"id": todo.pk, "todo_tile": "bulk"}], format="json")
+        self.assertEqual(self.get_title(f"/todo/todo/{todo.pk}/"), "bulk")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete("/todo/todo/bulk/", [todo.pk], format="json")
+        self.assertEqual(self.client.get(f"/todo/todo/{todo.pk}/").status_code, 404)
+
+    def test_detail_with_leading_zero_is_invalidated(self):
+        todo = self.todos[0]
+        path = f"/todo/todo/0{todo.pk}/"
+        self.assertEqual(self.get_title(path), "todo 0")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/todo/todo/{todo.pk}/", {"todo_tile": "changed"}, format="json")
+        self.assertEqual(self.get_title(path), "changed")
+
+    def test_if_none_match_returns_304(self):
+        path = f"/todo/todo/{self.todos[0].pk}/"
+        etag = self.client.get(path)["ETag"]
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.client.get("/todo/todo/", HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(path, {"todo_tile": "changed"}, format="json")
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class TodoListQueryPlanTests(TestCase):
+    """
+    the list filters and orderings have to be served by an index, not a scan of todo_todo
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        create_todos(30)
+
+    def get_query_plans(self, query_string):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/todo/todo/?{query_string}", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plans.append([row[-1] for row in cursor.fetchall()])
+        return plans
+
+    def assertNoTableScan(self, query_string, plans):
+        for plan in plans:
+            for detail in plan:
+                if detail.startswith("SCAN todo_todo"):
+                    self.assertIn("USING", detail, f"{query_string}: {plan}")
+
+    def test_filters_use_an_index(self):
+        for query_string in [
+            "created_after=2022-05-03T00:00:00Z",
+            "created_before=2022-05-10T00:00:00Z",
+            "created_after=2022-05-03T00:00:00Z&created_before=2022-05-10T00:00:00Z",
+            "title_prefix=todo%201",
+        ]:
+            with self.subTest(query_string):
+                self.assertNoTableScan(query_string, self.get_query_plans(query_string))
+
+    def test_orderings_use_an_index(self):
+        for field in TodoViewSet.ordering_fields:
+            for ordering in [field, f"-{field}"]:
+                with self.subTest(ordering):
+                    plans = self.get_query_plans(f"ordering={ordering}")
+                    # ordered by id sqlite walks the table b-tree itself, which is the rowid index
+                    if field != "id":
+                        self.assertNoTableScan(ordering, plans)
+                    for plan in plans:
+                        self.assertFalse(
+                            [detail for detail in plan if "TEMP B-TREE" in detail], f"{ordering}: {plan}"
+                        )
+
+    def test_list_is_one_query(self):
+        query_strings = ["", "serializer=fast", "title_prefix=todo&ordering=todo_tile", "ordering=updated_at"]
+        for field in TodoViewSet.ordering_fields:
+            for ordering in [field, f"-{field}"]:
+                query_strings.extend([f"ordering={ordering}", f"serializer=fast&ordering={ordering}"])
+        for query_string in query_strings:
+            cache.clear()
+            with self.subTest(query_string), self.assertNumQueries(1):
+                response = self.client.get(f"/todo/todo/?{query_string}&page_size=10", HTTP_ACCEPT="application/json")
+            self.assertEqual(response.status_code, 200, query_string)
+            # the cursor of the next page is built from the last row
+            self.assertIsNotNone(response.json()["next"], query_string)
+
+    def test_fast_path_orderings_read_their_fields(self):
+        for field in TodoViewSet.ordering_fields:
+            self.assertIn(field, TodoReadSerializer.fields)
+
+
+class TodoSearchTests(TestCase):
+    """
+    searches todos written through the api, so the full text index has to be kept
+    in sync by the triggers, which a rebuild of todo_todo (e.g. an AddField on
+    sqlite) drops
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get("/todo/todo/search/", {"q": query}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        return [todo["todo_tile"] for todo in response.json()]
+
+    def create(self, todo_tile, todo_description):
+        response = self.client.post(
+            "/todo/todo/",
+            {"todo_tile": todo_tile, "todo_description": todo_description, "todo_creation": "2022-05-03T10:00:00Z"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["id"]
+
+    def test_index_triggers_exist(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("the full text index is sqlite only")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'todo_todo'")
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(triggers, {"todo_todo_fts_insert", "todo_todo_fts_update", "todo_todo_fts_delete"})
+
+    def test_created_todos_are_found_ranked(self):
+        self.create("groceries", "buy milk and bread")
+        self.create("milk", "buy milk")
+        self.client.post(
+            "/todo/todo/bulk/",
+            [{"todo_tile": "laundry", "todo_description": "wash", "todo_creation": "2022-05-03T10:00:00Z"}],
+            format="json",
+        )
+        # a title hit ranks above a description hit
+        self.assertEqual(self.search("milk"), ["milk", "groceries"])
+        self.assertEqual(self.search("mil"), ["milk", "groceries"])
+        self.assertEqual(self.search("bre mil"), ["groceries"])
+        self.assertEqual(self.search("laund"), ["laundry"])
+        self.assertEqual(self.search("coffee"), [])
+
+    def test_updated_and_deleted_todos_are_reindexed(self):
+        todo_id = self.create("milk", "buy milk")
+        bulk_id = self.create("bread", "buy bread")
+        self.client.patch(f"/todo/todo/{todo_id}/", {"todo_tile": "coffee", "todo_description": "beans"}, format="json")
+        self.client.patch("/todo/todo/bulk/", [{"id": bulk_id, "todo_tile": "tea"}], format="json")
+        self.assertEqual(self.search("milk"), [])
+        self.assertEqual(self.search("coff"), ["coffee"])
+        self.assertEqual(self.search("tea"), ["tea"])
+        self.client.delete(f"/todo/todo/{todo_id}/")
+        self.assertEqual(self.search("coffee"), [])
+
+
+class AsyncTodoListTests(TestCase):
+    async def test_page_size_below_one_is_rejected(self):
+        for query_string in ["page_size=0", "page_size=x", "after=-1"]:
+            with self.subTest(query_string):
+                response = await self.async_client.get(f"/todo/async/todo/?{query_string}")
+                self.assertEqual(response.status_code, 400)
+
+    def test_session_post_needs_csrf_token(self):
+        User.objects.create_user("user", password="password")
+        client = Client(enforce_csrf_checks=True)
+        client.login(username="user", password="password")
+        response = client.post(
+            "/todo/async/todo/",
+            {"todo_tile": "todo", "todo_description": "description", "todo_creation": "2022-05-03T18:11:00Z"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class Pdf2txtSplitPagesTests(SimpleTestCase):
+    """
+    pdf2txt --jobs --split-pages writes byte for byte what the serial path writes
+    """
+
+    pdf_file = str(settings.BASE_DIR / "abc.pdf")
+
+    def extract(self, outfile, *args):
+        self.assertEqual(pdf2txt.main([self.pdf_file, "--no-cache", "-o", outfile, *args]), 0)
+
+    def test_split_pages_matches_serial_output(self):
+        for args in [
+            [],
+            ["--page-numbers", "2", "3", "-m", "3"],
+            ["-m", "5"],
+            ["--pagenos", "4,7,12"],
+            ["--pagenos", "4,7,12", "-m", "8"],
+        ]:
+            with self.subTest(args), tempfile.TemporaryDirectory() as tmpdir:
+                serial = os.path.join(tmpdir, "serial.txt")
+                split = os.path.join(tmpdir, "split.txt")
+                self.extract(serial, *args)
+                self.extract(split, "--jobs", "2", "--split-pages", *args)
+                self.assertTrue(os.path.getsize(serial))
+                self.assertTrue(filecmp.cmp(serial, split, shallow=False))
+
+
+class ExtractionCacheTests(SimpleTestCase):
+    def test_eviction_keeps_the_limit_and_skips_temp_files(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = pdf2txt.ExtractionCache(cache_dir, 1000)
+            in_flight = os.path.join(cache_dir, "in-flight.123.tmp")
+            with open(in_flight, "wb") as fp:
+                fp.write(b"x" * 5000)
+            for i in range(20):
+                cache.put(f"{i:064x}", b"x" * 100)
+            self.assertTrue(os.path.exists(in_flight))
+            self.assertLessEqual(sum(size for _, size, _ in cache.entries()), 1000)
+            self.assertIsNotNone(cache.get(f"{19:064x}"))
+            self.assertIsNone(cache.get(f"{0:064x}"))
+
+
+class PdfFileIssueTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.bills = os.path.join(self.tmpdir, "bills")
+        self.outdir = os.path.join(self.tmpdir, "out")
+        for name in ["house/hb1.pdf", "senate/hb1.pdf"]:
+            write_text_pdf(os.path.join(self.bills, name), f"text of {name} in its text layer")
+
+    def pdf_file_issue(self, *paths):
+        self.stderr = io.StringIO()
+        call_command(
+            "pdf_file_issue", *paths, "--jobs", "1", "--no_cache", "--outdir", self.outdir,
+            stdout=io.StringIO(), stderr=self.stderr,
+        )
+
+    def read_output(self, name):
+        with open(os.path.join(self.outdir, name)) as fp:
+            return fp.read()
+
+    def test_outputs_keep_the_path_relative_to_the_input(self):
+        self.pdf_file_issue(self.bills)
+        self.assertIn("text of house/hb1.pdf", self.read_output("house/hb1.txt"))
+        self.assertIn("text of senate/hb1.pdf", self.read_output("senate/hb1.txt"))
+
+        self.pdf_file_issue(os.path.join(self.bills, "*", "hb1.pdf"))
+        self.assertIn("text of senate/hb1.pdf", self.read_output("senate/hb1.txt"))
+
+    def test_same_output_name_is_an_error_not_an_overwrite(self):
+        house, senate = os.path.join(self.bills, "house", "hb1.pdf"), os.path.join(self.bills, "senate", "hb1.pdf")
+        with self.assertRaises(CommandError):
+            self.pdf_file_issue(house, senate)
+        self.assertIn("text of house/hb1.pdf", self.read_output("hb1.txt"))
+        self.assertIn(f"{senate} not extracted", self.stderr.getvalue())
+
+    def test_failed_documents_are_reported_and_skipped(self):
+        missing = os.path.join(self.tmpdir, "missing.pdf")
+        with self.assertRaisesMessage(CommandError, "1 of 2 pdf files not extracted"):
+            self.pdf_file_issue(missing, os.path.join(self.bills, "house", "hb1.pdf"))
+        self.assertIn(f"{missing} not extracted", self.stderr.getvalue())
+        self.assertIn("text of house/hb1.pdf", self.read_output("hb1.txt"))
+
+
+class SyncExtractedTextTests(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.paths = {}
+        for name in ["a_good", "c_good"]:
+            self.paths[name] = os.path.join(self.tmpdir, f"{name}.pdf")
+            write_text_pdf(self.paths[name], f"text of {name} in its text layer")
+
+    def sync(self, *args):
+        self.stderr = io.StringIO()
+        with mock.patch(
+            "todo.management.commands.sync_extracted_text.DocumentExtraction",
+            wraps=sync_extracted_text.DocumentExtraction,
+        ) as extraction:
+            call_command(
+                "sync_extracted_text", self.tmpdir, "--jobs", "1", *args, stdout=io.StringIO(), stderr=self.stderr
+            )
+        return sorted(os.path.basename(call.args[0]) for call in extraction.call_args_list)
+
+    def get_text(self, name):
+        return ExtractedDocument.objects.get(path=self.paths[name]).text
+
+    def test_only_changed_documents_are_extracted_again(self):
+        self.assertEqual(self.sync(), ["a_good.pdf", "c_good.pdf"])
+        self.assertIn("text of a_good", self.get_text("a_good"))
+        self.assertEqual(self.sync(), [])
+
+        # touched only, the hash is compared and the new mtime stored
+        stat = os.stat(self.paths["a_good"])
+        os.utime(self.paths["a_good"], (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(self.sync(), [])
+        self.assertEqual(ExtractedDocument.objects.get(path=self.paths["a_good"]).file_mtime, stat.st_mtime + 10)
+        self.assertEqual(self.sync(), [])
+
+        write_text_pdf(self.paths["c_good"], "new text of c_good in its text layer")
+        os.utime(self.paths["c_good"], (stat.st_atime, stat.st_mtime + 20))
+        self.assertEqual(self.sync(), ["c_good.pdf"])
+        self.assertIn("new text of c_good", self.get_text("c_good"))
+
+        self.assertEqual(self.sync("--force"), ["a_good.pdf", "c_good.pdf"])
+        self.assertEqual(self.sync("--min_chars", "5"), ["a_good.pdf", "c_good.pdf"])
+
+    def test_failed_documents_are_reported_and_skipped(self):
+        bad = os.path.join(self.tmpdir, "b_bad.pdf")
+        with open(bad, "w") as fp:
+            fp.write("not a pdf")
+        with self.assertRaisesMessage(CommandError, "1 of 3 pdf files not extracted"):
+            self.sync()
+        self.assertIn(f"{bad} not extracted", self.stderr.getvalue())
+        self.assertEqual(
+            sorted(ExtractedDocument.objects.values_list("path", flat=True)),
+            [self.paths["a_good"], self.paths["c_good"]],
+        )
+
+
+class Bill(models.Model):
+    """
+    stands in for directories.congress StateLegislatorBill, which is not part of this tree
+    """
+
+    class Meta:
+        app_label = "todo"
+
+
+class BillAction(models.Model):
+    """
+    stands in for directories.congress StateLegislatorBillAction
+    """
+    state_legislator_bill = models.ForeignKey(Bill, on_delete=models.CASCADE)
+    org_classification = models.CharField(max_length=100, blank=True)
+    org_name = models.CharField(max_length=100, blank=True)
+    description = models.TextField(blank=True)
+    order = models.CharField(max_length=20)
+    date = models.DateField(null=True)
+
+    class Meta:
+        app_label = "todo"
+
+
+class StoreBillActionsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # the sqlite schema editor can not run inside the transaction of the test case
+        with connection.schema_editor() as editor:
+            editor.create_model(Bill)
+            editor.create_model(BillAction)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            editor.delete_model(BillAction)
+            editor.delete_model(Bill)
+
+    def get_page(self, bill_count, actions_per_bill, description="introduced"):
+        bills = [Bill.objects.create() for _ in range(bill_count)]
+        return [
+            (
+                bill,
+                {
+                    "actions": [
+                        {
+                            "description": f"{description} {order}",
+                            "date": "2022-05-03T10:00:00+00:00",
+                            "order": order,
+                            "organization": {"name": "House", "classification": "lower"},
+                        }
+                        for order in range(actions_per_bill)
+                    ]
+                },
+            )
+            for bill in bills
+        ]
+
+    def test_queries_per_page_do_not_grow_with_the_actions(self):
+        # a page of 20 bills fits one batch of the insert and the update, bigger
+        # pages take a query per batch rather than per bill or action
+        for bill_count, actions_per_bill in [(1, 1), (20, 5)]:
+            with self.subTest(bill_count=bill_count):
+                bills = self.get_page(bill_count, actions_per_bill)
+                # read, savepoint, insert, release, the update has nothing to write
+                with self.assertNumQueries(4):
+                    self.assertEqual(store_bill_actions(bills, BillAction), (bill_count * actions_per_bill, 0))
+                for bill, bill_data in bills:
+                    bill_data["actions"][0]["description"] = "passed"
+                # read, savepoint, update, release
+                with self.assertNumQueries(4):
+                    self.assertEqual(store_bill_actions(bills, BillAction), (0, bill_count * actions_per_bill))
+        self.assertEqual(BillAction.objects.filter(description="passed").count(), 21)
+
+    def test_actions_are_stored_by_order(self):
+        bills = self.get_page(1, 2)
+        bill, bill_data = bills[0]
+        bill_data["actions"].append({"description": "later", "order": 1, "organization": None})
+        store_bill_actions(bills, BillAction)
+        self.assertEqual(
+            list(BillAction.objects.order_by("order").values_list("order", "description", "org_name", "date")),
+            [("0", "introduced 0", "House", date(2022, 5, 3)), ("1", "later", "", None)],
+        )
+
+
+class StubOpenStatesHandler(BaseHTTPRequestHandler):
+    """
+    answers with the next queued (status, headers) of the server, 200 when none is left
+    """
+
+    body = b'{"results": []}'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(time.monotonic())
+            status, headers = server.responses.pop(0) if server.responses else (200, {})
+        body = gzip.compress(self.body) if "gzip" in self.headers.get("Accept-Encoding", "") else self.body
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        if body is not self.body:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class OpenStatesGetTests(SimpleTestCase):
+    rate = 20
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenStatesHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/bills"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.responses = []
+        self.bucket = openstates.TokenBucket(self.rate)
+
+    def get_in_threads(self, count, threads=8):
+        with ThreadPoolExecutor(threads) as executor:
+            return [
+                response.status_code
+                for response in executor.map(lambda _: openstates.openstates_get(self.url, self.bucket), range(count))
+            ]
+
+    def test_threads_stay_within_the_rate(self):
+        self.assertEqual(self.get_in_threads(self.rate * 2), [200] * self.rate * 2)
+        requests = self.server.requests
+        per_second = max(sum(1 for other in requests if start <= other < start + 1) for start in requests)
+        # the capacity of the bucket and a little scheduling jitter on top of the rate
+        self.assertLessEqual(per_second, self.rate + 2)
+
+    def test_requests_queued_during_a_pause_go_out_at_rate(self):
+        self.server.responses = [(429, {"Retry-After": "1"})]
+        self.assertEqual(self.get_in_threads(8), [200] * 8)
+        paused, *after_pause = self.server.requests
+        self.assertEqual(len(after_pause), 8)
+        self.assertGreaterEqual(after_pause[0] - paused, 0.9)
+        gaps = [later - earlier for earlier, later in zip(after_pause, after_pause[1:])]
+        self.assertGreaterEqual(min(gaps), 0.5 / self.rate, gaps)
+
+    def test_short_retry_after_is_retried(self):
+        self.server.responses = [(429, {"Retry-After": "1"})]
+        start = time.monotonic()
+        response = openstates.openstates_get(self.url, self.bucket)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+
+    def test_server_errors_are_retried_taking_a_token_each(self):
+        self.server.responses = [(503, {}), (500, {})]
+        with mock.patch.object(openstates, "SERVER_ERROR_BACKOFF", 0.01), \
+                mock.patch.object(self.bucket, "acquire", wraps=self.bucket.acquire) as acquire:
+            response = openstates.openstates_get(self.url, self.bucket)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(acquire.call_count, 3)
+
+    def test_server_errors_are_returned_after_the_last_retry(self):
+        self.server.responses = [(503, {})] * openstates.MAX_RETRIES
+        with mock.patch.object(openstates, "SERVER_ERROR_BACKOFF", 0.01):
+            response = openstates.openstates_get(self.url, self.bucket)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.server.requests), openstates.MAX_RETRIES)
+
+    def test_spent_key_is_returned(self):
+        for headers in [{"Retry-After": str(openstates.MAX_RETRY_AFTER + 1)}, {}]:
+            with self.subTest(headers):
+                self.server.requests = []
+                self.server.responses = [(429, headers)]
+                response = openstates.openstates_get(self.url, self.bucket)
+                self.assertEqual(response.status_code, 429)
+                self.assertTrue(openstates.is_quota_spent(response))
+                self.assertEqual(len(self.server.requests), 1)
+
+    def test_downloaded_bytes_are_the_compressed_body(self):
+        response = openstates.openstates_get(self.url, self.bucket)
+        self.assertEqual(response.content, StubOpenStatesHandler.body)
+        self.assertEqual(openstates.get_downloaded_bytes(response), len(gzip.compress(StubOpenStatesHandler.body)))
+
+
+class LegislatorNameIndexTests(SimpleTestCase):
+    def legislator(self, pk, first_name, last_name, full_response):
+        return SimpleNamespace(pk=pk, first_name=first_name, last_name=last_name, full_response=full_response)
+
+    def test_lookup_by_full_name_alias_and_part(self):
+        jane = self.legislator(2, "Jane", "Doe", {"name": "Jane Q. Doe", "other_names": [{"name": "Janie Doe"}]})
+        john = self.legislator(1, "John", "Smith", {"given_name": "Johnny", "family_name": "Smith"})
+        index = LegislatorNameIndex([jane, john], fuzzy_cutoff=0.8)
+        self.assertIs(index.lookup("JANE  doe"), jane)
+        self.assertIs(index.lookup("Janie Doe"), jane)
+        self.assertIs(index.lookup("Johnny Smith"), john)
+        self.assertIs(index.lookup("Smith"), john)
+        self.assertIs(index.lookup("Jane Q Doe"), jane)
+        self.assertIsNone(index.lookup("Nobody"))
+
+    def test_full_response_of_unexpected_shape_is_ignored(self):
+        legislators = [
+            self.legislator(1, "A", "One", None),
+            self.legislator(2, "B", "Two", ["not", "a", "dict"]),
+            self.legislator(3, "C", "Three", {"name": 3, "other_names": {"name": "x"}}),
+            self.legislator(4, "D", "Four", {"other_names": ["Dee Four", None, {"name": None}, {"name": "Dee"}]}),
+            self.legislator(5, "E", "Five", {"given_name": "", "family_name": "Five", "name": ["E"]}),
+        ]
+        index = LegislatorNameIndex(legislators)
+        self.assertEqual(index.aliases, {"dee": legislators[3]})
+        self.assertIs(index.lookup("Two"), legislators[1])